@@ -0,0 +1,137 @@
+"""
+Memory usage of the records created during resolution.
+
+usage: python debug/bench_memory.py [requirements.txt]
+
+Without arguments, creates candidates, provider infos, wheel releases and requirements like the
+providers do for a large package, once as the former dataclasses and once as the current records,
+and reports the allocated memory of both.
+With a requirements file, resolves it (building the data via nix, like debug.py does) and reports
+the peak RSS, which can be compared against another revision.
+"""
+import gc
+import os
+import resource
+import subprocess as sp
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import dataclass
+from os.path import realpath, dirname
+from typing import Any
+
+from mach_nix.data.nixpkgs import NixpkgsIndex
+from mach_nix.data.providers import Candidate, ProviderInfo, WheelRelease, CombinedDependencyProvider, ProviderSettings
+from mach_nix.requirements import parse_reqs, parse_reqs_line, filter_reqs_by_eval_marker, context
+from mach_nix.resolver.resolvelib_resolver import ResolvelibResolver
+from mach_nix.versions import PyVer, parse_ver
+
+pwd = dirname(realpath(__file__))
+N = 100_000
+
+
+@dataclass
+class OldCandidate:
+    name: str
+    ver: Any
+    raw_version: str
+    selected_extras: tuple
+    provider_info: Any
+    build: str = None
+
+
+@dataclass
+class OldProviderInfo:
+    provider: Any
+    wheel_fname: str = None
+    url: str = None
+    hash: str = None
+    data: Any = None
+
+
+class OldRequirement:
+    def __init__(self, name, extras, specs, build=None, marker=None):
+        self.name = name.lower().replace('_', '-')
+        self.extras = extras or tuple()
+        self.specs = specs or tuple()
+        self.build = build
+        self.marker = marker
+
+
+@dataclass
+class OldWheelRelease:
+    fn_pyver: str
+    name: str
+    ver: str
+    fn: str
+    requires_dist: list
+    provided_extras: list
+    requires_python: str
+
+
+def measure(create):
+    gc.collect()
+    tracemalloc.start()
+    records = create()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def create_records(candidate_cls, info_cls, wheel_cls, make_reqs):
+    versions = [parse_ver(f"1.{i // 100}.{i % 100}") for i in range(N)]
+    records = []
+    for ver in versions:
+        raw = str(ver)
+        fn = f"boto3-{raw}-py2.py3-none-any.whl"
+        reqs = ["botocore<1.20.0,>=1.19.0", "jmespath<1.0.0,>=0.7.1", "s3transfer<0.4.0,>=0.3.0"]
+        parsed = make_reqs(reqs)
+        wheel = wheel_cls('py2.py3', 'boto3', raw, fn, reqs, None, None)
+        info = info_cls(provider=None, wheel_fname=fn, data=wheel)
+        records.append((candidate_cls('boto3', ver, raw, (), info), parsed))
+    return records
+
+
+def synthetic():
+    old = measure(lambda: create_records(
+        OldCandidate, OldProviderInfo, OldWheelRelease,
+        lambda reqs: [OldRequirement(*parse_reqs_line(line)) for line in reqs]))
+    new = measure(lambda: create_records(Candidate, ProviderInfo, WheelRelease, lambda reqs: list(parse_reqs(reqs))))
+    print(f"{N} candidates incl. provider info, wheel release and 3 requirements each")
+    print(f"  dataclasses  {old / 2 ** 20:8.1f} MiB")
+    print(f"  records      {new / 2 ** 20:8.1f} MiB  ({1 - new / old:.0%} less)")
+
+
+def nix_build(expr, attr=None):
+    out = tempfile.mktemp()
+    attr = f"-A {attr}" if attr else ""
+    sp.check_call(f'nix-build {pwd}/../mach_nix/nix/{expr} {attr} -o {out}', shell=True)
+    return out
+
+
+def resolution(file):
+    py_ver = PyVer(os.environ.get('py_ver_str', '3.9.5'))
+    platform, system = os.environ.get('system', 'x86_64-linux').split('-')
+    nixpkgs = NixpkgsIndex(nix_build('nixpkgs-json.nix'))
+    deps_provider = CombinedDependencyProvider(
+        conda_channels_json=nix_build('conda-channels.nix', 'condaChannelsJson'),
+        nixpkgs=nixpkgs,
+        provider_settings=ProviderSettings(nix_build('lib.nix', 'parseProvidersToJson')),
+        pypi_deps_db_src=nix_build('deps-db-and-fetcher.nix', 'pypi_deps_db_src'),
+        py_ver=py_ver,
+        platform=platform,
+        system=system,
+    )
+    with open(file) as f:
+        reqs = list(filter_reqs_by_eval_marker(parse_reqs(f.read()), context(py_ver, platform, system)))
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ResolvelibResolver(nixpkgs, deps_provider).resolve(reqs)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS: {after / 1024:.1f} MiB ({(after - before) / 1024:.1f} MiB during resolution)")
+
+
+if len(sys.argv) > 1:
+    resolution(sys.argv[1])
+else:
+    synthetic()
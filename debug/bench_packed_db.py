@@ -0,0 +1,59 @@
+"""
+Compares lookups in the json bucket DB against the packed DB format.
+
+usage: PYPI_DATA=<pypi-deps-db> python debug/bench_packed_db.py [names.txt]
+
+If no file with package names (one per line) is given, 300 random names are picked from the DB.
+Packed DB files are built into a temporary directory if not present next to the json buckets.
+"""
+import os
+import random
+import sys
+import tempfile
+from time import time
+
+from mach_nix.data.bucket_dict import LazyBucketDict
+from mach_nix.data.packed_db import PackedDict, pack_bucket_dir, PACKED_EXT
+
+
+def lookup_all(db, names):
+    found = 0
+    for name in names:
+        if name in db:
+            db[name]
+            found += 1
+    return found
+
+
+def bench(name, make_db, names):
+    start = time()
+    db = make_db()
+    found = lookup_all(db, names)
+    dur = time() - start
+    print(f"  {name:<8} {dur:8.3f}s  ({found} packages found)")
+
+
+def main():
+    db_dir = os.environ["PYPI_DATA"]
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            names = [l.strip() for l in f if l.strip()]
+    else:
+        random.seed(0)
+        all_names = list(LazyBucketDict(f"{db_dir}/sdist").keys())
+        names = random.sample(all_names, 300)
+    tmp_dir = tempfile.mkdtemp()
+    for kind in ('sdist', 'wheel'):
+        json_dir = f"{db_dir}/{kind}"
+        packed_file = f"{json_dir}{PACKED_EXT}"
+        if not os.path.isfile(packed_file):
+            packed_file = f"{tmp_dir}/{kind}{PACKED_EXT}"
+            start = time()
+            pack_bucket_dir(json_dir, packed_file)
+            print(f"packing {kind} took {time() - start:.1f}s")
+        print(f"{kind}: looking up {len(names)} packages")
+        bench('json', lambda: LazyBucketDict(json_dir), names)
+        bench('packed', lambda: PackedDict(packed_file), names)
+
+
+main()
@@ -0,0 +1,80 @@
+"""
+Compares the regex based requirement parser against the fast path parser on the whole dependency DB.
+
+usage: PYPI_DATA=<pypi-deps-db> python debug/bench_requirements.py [limit]
+
+Collects all requirement lines of the sdist and wheel DB (optionally only the first `limit`).
+Reports the timings of both parsers, of the cached lookups, and all lines for which their results differ.
+"""
+import os
+import sys
+import warnings
+from time import time
+
+from mach_nix.data.packed_db import open_db
+from mach_nix.requirements import normalize_line, parse_line_fast, parse_line_regex, parse_req, \
+    parse_specifiers
+
+
+def sdist_lines(data):
+    for name in data.keys():
+        for ver, pyvers in data[name].items():
+            for pyver, release in pyvers.items():
+                if isinstance(release, str):
+                    continue
+                for key in ("setup_requires", "install_requires"):
+                    yield from release.get(key, ())
+                for lines in release.get("extras_require", {}).values():
+                    yield from lines
+
+
+def wheel_lines(data):
+    for name in data.keys():
+        for pyver, vers in data[name].items():
+            for ver, fns in vers.items():
+                for fn, deps in fns.items():
+                    if isinstance(deps, dict):
+                        yield from deps.get("requires_dist") or ()
+
+
+def parse(parser, line):
+    try:
+        return parser(line)
+    except Exception as e:
+        return type(e)
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    db = os.environ['PYPI_DATA']
+    lines = list(sdist_lines(open_db(f"{db}/sdist"))) + list(wheel_lines(open_db(f"{db}/wheel")))
+    lines = [normalize_line(line) for line in lines[:limit] if isinstance(line, str)]
+    unique = set(lines)
+    print(f"parsing {len(lines)} requirement lines ({len(unique)} unique)")
+    warnings.simplefilter('ignore')
+
+    start = time()
+    old = [parse(parse_line_regex, line) for line in lines]
+    print(f"  regex   {time() - start:8.3f}s")
+    parse_specifiers.cache.clear()
+
+    start = time()
+    new = [parse(parse_line_fast, line) for line in lines]
+    print(f"  fast    {time() - start:8.3f}s  ({sum(r is not None for r in new) / max(len(lines), 1):.1%} on the fast path)")
+
+    start = time()
+    for line in lines:
+        parse(parse_req, line)
+    print(f"  cached  {time() - start:8.3f}s  (first pass, caching by line)")
+    start = time()
+    for line in lines:
+        parse(parse_req, line)
+    print(f"  memo    {time() - start:8.3f}s  (repeated lookups)")
+
+    diffs = [(line, o, n) for line, o, n in zip(lines, old, new) if n is not None and o != n]
+    print(f"{len(diffs)} differences (regex -> fast)")
+    for line, o, n in diffs:
+        print(f"  {line}: {o} -> {n}")
+
+
+main()
@@ -0,0 +1,85 @@
+"""
+Resolves the requirement files in ./hard_requirements with each resolver preference strategy
+and reports the number of resolution rounds and the wall time.
+
+usage: python debug/bench_resolver_preferences.py [requirements.txt ...]
+
+Builds the nixpkgs json, the dependency DB and the providers via nix, like debug.py does.
+"""
+import os
+import subprocess as sp
+import sys
+import tempfile
+from glob import glob
+from os.path import realpath, dirname
+from time import time
+
+import resolvelib
+
+from mach_nix.data.nixpkgs import NixpkgsIndex
+from mach_nix.data.providers import CombinedDependencyProvider, ProviderSettings
+from mach_nix.requirements import parse_reqs, filter_reqs_by_eval_marker, context
+from mach_nix.resolver.preferences import strategies
+from mach_nix.resolver.resolvelib_resolver import ResolvelibResolver
+from mach_nix.versions import PyVer
+
+pwd = dirname(realpath(__file__))
+
+
+class RoundCounter(resolvelib.BaseReporter):
+    def __init__(self):
+        self.rounds = 0
+        self.backtracks = 0
+
+    def starting_round(self, index):
+        self.rounds = index + 1
+
+    def backtracking(self, candidate):
+        self.backtracks += 1
+
+
+def nix_build(expr, attr=None):
+    out = tempfile.mktemp()
+    attr = f"-A {attr}" if attr else ""
+    sp.check_call(f'nix-build {pwd}/../mach_nix/nix/{expr} {attr} -o {out}', shell=True)
+    return out
+
+
+def main():
+    files = sys.argv[1:] or sorted(glob(f"{pwd}/hard_requirements/*.txt"))
+    py_ver = PyVer(os.environ.get('py_ver_str', '3.9.5'))
+    platform, system = os.environ.get('system', 'x86_64-linux').split('-')
+    nixpkgs_json = nix_build('nixpkgs-json.nix')
+    pypi_deps_db_src = nix_build('deps-db-and-fetcher.nix', 'pypi_deps_db_src')
+    providers_json = nix_build('lib.nix', 'parseProvidersToJson')
+    conda_channels_json = nix_build('conda-channels.nix', 'condaChannelsJson')
+    nixpkgs = NixpkgsIndex(nixpkgs_json)
+
+    print(f"{'requirements':<20} {'strategy':<12} {'rounds':>7} {'backtracks':>11} {'time':>9}  result")
+    for file in files:
+        with open(file) as f:
+            reqs_str = f.read()
+        for name in sorted(strategies):
+            deps_provider = CombinedDependencyProvider(
+                conda_channels_json=conda_channels_json,
+                nixpkgs=nixpkgs,
+                provider_settings=ProviderSettings(providers_json),
+                pypi_deps_db_src=pypi_deps_db_src,
+                py_ver=py_ver,
+                platform=platform,
+                system=system,
+            )
+            reqs = list(filter_reqs_by_eval_marker(parse_reqs(reqs_str), context(py_ver, platform, system)))
+            reporter = RoundCounter()
+            start = time()
+            try:
+                ResolvelibResolver(nixpkgs, deps_provider, name, reporter).resolve(reqs)
+                result = "ok"
+            except Exception as e:
+                result = type(e).__name__
+            dur = time() - start
+            print(f"{os.path.basename(file):<20} {name:<12} {reporter.rounds:>7} {reporter.backtracks:>11} "
+                  f"{dur:>8.1f}s  {result}")
+
+
+main()
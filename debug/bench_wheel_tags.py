@@ -0,0 +1,64 @@
+"""
+Compares the old regex based wheel compatibility check against the pre-indexed wheel tags.
+
+usage: PYPI_DATA=<pypi-deps-db> python debug/bench_wheel_tags.py [bucket] [py_ver] [system] [platform]
+
+All wheel filenames of one bucket of the wheel DB (default: 00) are checked for compatibility.
+Reports the timings of both approaches and all filenames for which their results differ.
+"""
+import json
+import os
+import re
+import sys
+from time import time
+
+from mach_nix.data.wheel_tags import WheelTagPriorities
+from mach_nix.versions import PyVer
+
+
+def regex_patterns(py_ver: PyVer, system, platform):
+    maj = py_ver.version.release[0]
+    min = py_ver.version.release[1]
+    cp_abi = f"cp{maj}{min}mu" if int(maj) == 2 else f"cp{maj}{min}m?"
+    prefix = rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-"
+    if system == "linux":
+        suffixes = (f"manylinux2014_{platform}", f"manylinux2010_{platform}", f"manylinux1_{platform}",
+                    f"manylinux_2_5_{platform}", f"manylinux_2_12_{platform}", f"manylinux_2_17_{platform}",
+                    f"linux_{platform}", "any")
+    else:
+        platform = "arm64" if platform == "aarch64" else platform
+        suffixes = ("any", r"macosx_\d*_\d*_universal", rf"macosx_\d*_\d*_{platform}")
+    return [re.compile(prefix + s) for s in suffixes]
+
+
+def main():
+    bucket = sys.argv[1] if len(sys.argv) > 1 else "00"
+    py_ver = PyVer(sys.argv[2] if len(sys.argv) > 2 else "3.9.0")
+    system = sys.argv[3] if len(sys.argv) > 3 else "linux"
+    platform = sys.argv[4] if len(sys.argv) > 4 else "x86_64"
+    with open(f"{os.environ['PYPI_DATA']}/wheel/{bucket}.json") as f:
+        data = json.load(f)
+    fns = [fn for pyvers in data.values() for vers in pyvers.values() for fns in vers.values() for fn in fns]
+    print(f"checking {len(fns)} wheel filenames for python {py_ver} on {platform}-{system}")
+
+    patterns = regex_patterns(py_ver, system, platform)
+    start = time()
+    old = [next((i for i, p in enumerate(patterns) if re.search(p, fn)), None) for fn in fns]
+    print(f"  regex   {time() - start:8.3f}s")
+
+    tags = WheelTagPriorities(py_ver, platform, system)
+    start = time()
+    new = [tags.priority(fn) for fn in fns]
+    print(f"  tags    {time() - start:8.3f}s")
+    start = time()
+    for fn in fns:
+        tags.priority(fn)
+    print(f"  memo    {time() - start:8.3f}s  (repeated lookups)")
+
+    diffs = [(fn, o, n) for fn, o, n in zip(fns, old, new) if o != n]
+    print(f"{len(diffs)} differences (priority regex -> tags)")
+    for fn, o, n in diffs:
+        print(f"  {fn}: {o} -> {n}")
+
+
+main()
@@ -1 +1,4 @@
-from .run import main
\ No newline at end of file
+def main():
+    # the cli imports modules which aren't needed when only the resolver is used
+    from .run import main
+    main()
@@ -1,21 +1,123 @@
+import os
+import sys
+from collections import OrderedDict, namedtuple
+from functools import wraps
 from inspect import isgenerator
+from typing import List, Optional
 
-cache = {}
+CacheInfo = namedtuple("CacheInfo", "name hits misses size maxsize")
 
 
-def cached(keyfunc=None):
+class FunctionCache:
+    """
+    Result cache of a single function decorated with `cached`.
+    If `maxsize` is set, the least recently used results are dropped once it is exceeded.
+    """
+
+    def __init__(self, name, maxsize=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.data = OrderedDict() if maxsize else {}
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.name, self.hits, self.misses, len(self.data), self.maxsize)
+
+    def clear(self):
+        self.data.clear()
+        self.hits = self.misses = 0
+
+
+_caches: List[FunctionCache] = []
+
+
+def cached(keyfunc=None, maxsize=None):
     def cached_deco(func):
+        fcache = FunctionCache(f"{func.__module__}.{func.__qualname__}", maxsize)
+        _caches.append(fcache)
+        data = fcache.data
+
+        @wraps(func)
         def cache_wrapper(*args, **kwargs):
-            args_save = keyf(args)
-            key = (func, args_save, tuple(kwargs.items()))
-            if key not in cache:
-                result = func(*args, **kwargs)
-                if isgenerator(result):
-                    result = tuple(result)
-                cache[key] = result
-            return cache[key]
+            key = (keyf(args), tuple(kwargs.items()))
+            try:
+                result = data[key]
+            except KeyError:
+                pass
+            else:
+                fcache.hits += 1
+                if maxsize:
+                    data.move_to_end(key)
+                return result
+            fcache.misses += 1
+            result = func(*args, **kwargs)
+            if isgenerator(result):
+                result = tuple(result)
+            data[key] = result
+            if maxsize and len(data) > maxsize:
+                data.popitem(last=False)
+            return result
+
+        cache_wrapper.cache = fcache
         return cache_wrapper
 
     keyf = (lambda x: x) if keyfunc is None else keyfunc
     return cached_deco
 
+
+def cache_info() -> List[CacheInfo]:
+    return [c.info() for c in _caches]
+
+
+def clear_caches():
+    """
+    Drops all cached results. Long lived processes can use this to release memory between resolutions.
+    """
+    for c in _caches:
+        c.clear()
+
+
+def print_cache_stats(file=sys.stderr):
+    print("\n### Cache statistics ###", file=file)
+    print(f"{'function':<70} {'hits':>9} {'misses':>9} {'size':>9} {'maxsize':>9}", file=file)
+    for info in sorted(cache_info(), key=lambda i: i.hits + i.misses, reverse=True):
+        if not info.hits + info.misses:
+            continue
+        print(f"{info.name:<70} {info.hits:>9} {info.misses:>9} {info.size:>9} {info.maxsize or '-':>9}", file=file)
+
+
+def persistent_cache_dir(name) -> Optional[str]:
+    """
+    Returns a writable directory for caches which persist across runs or None if there is none.
+    The base directory can be set via MACHNIX_CACHE_DIR. Setting it to an empty string disables caching.
+    Inside the nix build sandbox, the default location is not writable and caching is skipped.
+    """
+    base = os.environ.get("MACHNIX_CACHE_DIR")
+    if base is None:
+        xdg_cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        base = f"{xdg_cache}/mach-nix"
+    if not base:
+        return None
+    directory = f"{base}/{name}"
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(directory, os.W_OK):
+        return None
+    return directory
+
+
+def prune_cache_dir(directory, ext, keep):
+    """
+    Removes all but the `keep` most recently used files ending with `ext` from a cache directory
+    """
+    files = sorted(
+        (f"{directory}/{f}" for f in os.listdir(directory) if f.endswith(ext)),
+        key=os.path.getmtime, reverse=True)
+    for file in files[keep:]:
+        try:
+            os.remove(file)
+        except OSError:
+            pass
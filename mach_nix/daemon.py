@@ -0,0 +1,229 @@
+"""
+Resolver daemon, which keeps the nixpkgs index, the dependency DB and the providers loaded between resolutions.
+
+  python -m mach_nix.daemon serve [--socket PATH]
+  python -m mach_nix.daemon resolve
+
+`resolve` is a drop-in for generate.py. It reads the same env variables and writes `out_file`.
+generate.py delegates to the daemon as well, if MACHNIX_DAEMON_SOCKET is set.
+
+Each connection carries one json request and one json response:
+  request:  {"inputs": {<GenerateInputs>}, "py_ver_str": "3.9.5", "system": "x86_64-linux"}
+  response: {"ok": true, "expr": "<nix expression>", "output": "<log of the resolution>", "error": null}
+"""
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stdout, redirect_stderr
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Optional
+
+from mach_nix.inputs import GenerateInputs, load_env, load_inputs
+
+
+# providers kept warm for different inputs and targets, the least recently used are dropped
+MAX_PROVIDERS = 8
+# the caches are cleared after a request once they hold more results than this
+MAX_CACHED_RESULTS = int(os.environ.get('MACHNIX_DAEMON_MAX_CACHED_RESULTS', 2_000_000))
+
+
+def default_socket_dir() -> str:
+    """
+    Directory of the default socket, only accessible by the current user
+    """
+    return f"{os.environ.get('XDG_RUNTIME_DIR', '/tmp')}/mach-nix-{os.getuid()}"
+
+
+def default_socket() -> str:
+    return os.environ.get('MACHNIX_DAEMON_SOCKET') or f"{default_socket_dir()}/daemon.sock"
+
+
+def request_resolution(socket_path, inputs: GenerateInputs, py_ver_str, system) -> Optional[dict]:
+    """
+    Sends a resolution request to the daemon. Returns None if the daemon isn't reachable.
+    """
+    payload = dict(inputs=asdict(inputs), py_ver_str=py_ver_str, system=system)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(payload).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(1 << 16)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+    except OSError:
+        return None
+    try:
+        return json.loads(b"".join(chunks))
+    except ValueError as e:
+        return dict(ok=False, expr=None, output='', error=f"malformed response from resolver daemon: {e}")
+
+
+class ResolverState:
+    """
+    Data kept warm between requests. Providers are reused for requests with the same inputs and target,
+    so their caches survive as well.
+    """
+
+    def __init__(self):
+        self.nixpkgs = {}
+        self.providers = OrderedDict()
+
+    def nixpkgs_index(self, nixpkgs_json):
+        from mach_nix.data.nixpkgs import NixpkgsIndex
+        from mach_nix.fingerprint import file_fingerprint
+        key = file_fingerprint(nixpkgs_json)
+        if key not in self.nixpkgs:
+            self.nixpkgs[key] = NixpkgsIndex(nixpkgs_json)
+        return self.nixpkgs[key]
+
+    def provider(self, inputs: GenerateInputs, py_ver_str, system, nixpkgs):
+        from mach_nix.cache import clear_caches
+        from mach_nix.generate import create_provider, conda_repodata_fingerprints
+        from mach_nix.fingerprint import file_fingerprint, dir_fingerprint
+        from mach_nix.versions import PyVer
+        key = (
+            file_fingerprint(inputs.providers_json),
+            file_fingerprint(inputs.conda_channels_json),
+            json.dumps(conda_repodata_fingerprints(inputs.conda_channels_json), sort_keys=True),
+            file_fingerprint(inputs.nixpkgs_json),
+            dir_fingerprint(f"{inputs.pypi_deps_db_src}/sdist"),
+            dir_fingerprint(f"{inputs.pypi_deps_db_src}/wheel"),
+            py_ver_str,
+            system,
+        )
+        if key in self.providers:
+            self.providers.move_to_end(key)
+            return self.providers[key]
+        if len(self.providers) >= MAX_PROVIDERS:
+            self.providers.popitem(last=False)
+            # the caches still hold results of the dropped provider
+            clear_caches()
+        provider = self.providers[key] = create_provider(inputs, PyVer(py_ver_str), system, nixpkgs)
+        return provider
+
+    def limit_caches(self):
+        from mach_nix.cache import cache_info, clear_caches
+        if sum(info.size for info in cache_info()) > MAX_CACHED_RESULTS:
+            clear_caches()
+
+    def resolve(self, inputs: GenerateInputs, py_ver_str, system) -> Optional[str]:
+        from mach_nix.generate import resolve_expr
+        nixpkgs = self.nixpkgs_index(inputs.nixpkgs_json)
+        deps_provider = self.provider(inputs, py_ver_str, system, nixpkgs)
+        return resolve_expr(inputs, py_ver_str, system, nixpkgs=nixpkgs, deps_provider=deps_provider)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        output = io.StringIO()
+        try:
+            request = json.loads(self.rfile.readline())
+            with redirect_stdout(output), redirect_stderr(output):
+                expr = self.server.state.resolve(
+                    GenerateInputs(**request['inputs']), request['py_ver_str'], request['system'])
+            response = dict(ok=expr is not None, expr=expr, output=output.getvalue(), error=None)
+        except KeyboardInterrupt:
+            raise
+        # the resolver exits on some errors, which must not stop the daemon
+        except BaseException as e:
+            response = dict(ok=False, expr=None, output=output.getvalue(), error=f"{type(e).__name__}: {e}")
+        self.wfile.write(json.dumps(response).encode())
+        self.server.state.limit_caches()
+
+
+class ResolverServer(socketserver.UnixStreamServer):
+    """
+    Handles one request at a time, since the providers and their caches are not thread safe
+    """
+
+    def __init__(self, socket_path):
+        self.state = ResolverState()
+        prepare_socket_path(socket_path)
+        super().__init__(socket_path, RequestHandler)
+
+    def server_bind(self):
+        # create the socket accessible only by the current user, without a window in between
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+
+def prepare_socket_path(socket_path):
+    """
+    Creates the per-user directory of the default socket and removes a stale socket of a previous daemon.
+    Refuses to use paths which are owned by another user.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if directory == os.path.abspath(default_socket_dir()):
+        if not os.path.lexists(directory):
+            os.mkdir(directory, 0o700)
+        st = os.lstat(directory)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077:
+            raise PermissionError(f"{directory} must be a directory only accessible by the current user")
+    try:
+        st = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{socket_path} exists and is not a socket of the current user")
+    os.remove(socket_path)
+
+
+def serve(socket_path):
+    # import the resolver upfront instead of during the first request
+    import mach_nix.generate  # noqa: F401
+    with ResolverServer(socket_path) as server:
+        print(f"mach-nix resolver daemon listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def resolve(socket_path):
+    response = request_resolution(socket_path, load_inputs(), load_env('py_ver_str'), load_env('system'))
+    if response is None:
+        print(f"Error: resolver daemon not reachable via {socket_path}", file=sys.stderr)
+        exit(1)
+    print_response(response)
+    if not response['ok']:
+        exit(1)
+    with open(load_env('out_file'), 'w') as f:
+        f.write(response['expr'])
+
+
+def print_response(response: dict):
+    print(response['output'], end='')
+    if response['error']:
+        print(f"Error in resolver daemon: {response['error']}", file=sys.stderr)
+
+
+def main():
+    parser = ArgumentParser(prog='python -m mach_nix.daemon', description='mach-nix resolver daemon')
+    parser.add_argument('command', choices=('serve', 'resolve'))
+    parser.add_argument('--socket', default=None, help='path of the unix socket')
+    args = parser.parse_args()
+    socket_path = args.socket or default_socket()
+    if args.command == 'serve':
+        serve(socket_path)
+    else:
+        resolve(socket_path)
+
+
+if __name__ == "__main__":
+    main()
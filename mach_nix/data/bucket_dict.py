@@ -2,6 +2,7 @@ import json
 import os
 from _sha256 import sha256
 from collections import UserDict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 
 class LazyBucketDict(UserDict):
@@ -10,6 +11,7 @@ class LazyBucketDict(UserDict):
         super().__init__()
         self.directory = directory
         self.data = {}
+        self._pending = {}
         if data:
             for key, val in data.items():
                 self.__setitem__(key, val)
@@ -72,14 +74,34 @@ class LazyBucketDict(UserDict):
         for bucket in self.data.keys():
             self.save_bucket(bucket, self.directory)
 
-    def load_bucket(self, bucket):
+    def _read_bucket(self, bucket):
         file = f"{self.directory}/{bucket}.json"
         if not os.path.isfile(file):
-            self.data[bucket] = {}
-        else:
-            with open(file) as f:
-                self.data[bucket] = json.load(f)
+            return {}
+        with open(file) as f:
+            return json.load(f)
+
+    def load_bucket(self, bucket):
+        self.data[bucket] = self._read_bucket(bucket)
 
     def ensure_bucket_loaded(self, bucket):
         if bucket not in self.data:
-            self.load_bucket(bucket)
+            future = self._pending.pop(bucket, None)
+            if future is not None:
+                self.data[bucket] = future.result()
+            else:
+                self.load_bucket(bucket)
+
+    def prefetch(self, keys, max_workers=8):
+        """
+        Starts loading the buckets of `keys` in background threads.
+        Returns immediately. Accessing a key waits only for its own bucket.
+        """
+        buckets = {self.bucket(key) for key in keys} - set(self.data) - set(self._pending)
+        if not buckets:
+            return
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(buckets)))
+        for bucket in sorted(buckets):
+            self._pending[bucket] = executor.submit(self._read_bucket, bucket)
+        # submitted buckets are still loaded, the threads exit afterwards
+        executor.shutdown(wait=False)
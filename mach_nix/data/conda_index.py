@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from array import array
+from collections import defaultdict
+from json import JSONDecodeError
+from typing import Iterator, List, Mapping, Tuple
+
+from mach_nix.cache import cached, persistent_cache_dir, prune_cache_dir
+from mach_nix.requirements import parse_reqs
+from mach_nix.fingerprint import file_fingerprint
+from mach_nix.versions import Version
+from .packed_db import PackedDict, PackedDBError, pack_encoded, PACKED_EXT
+
+# Conda repodata files are large json documents of the form:
+#   {"info": {...}, "packages": {"<fname>": {<record>}, ...}, "packages.conda": {...}, ...}
+# Instead of loading a whole file, the records in "packages" are streamed once into
+# a packed DB file which maps each normalized package name to its (fname, record, python_constraint)
+# entries. Only the records of packages which are actually requested are decoded later on.
+# If the index can't be persisted (eg. inside the nix sandbox), building it would cost more than it saves.
+# In that case the repodata is loaded as a whole into an index of the same shape.
+
+INDEX_FORMAT = 2
+INDEX_KEEP = 20
+CHUNK_SIZE = 1 << 20
+WHITESPACE = ' \t\n\r'
+
+
+def normalize_name(name: str) -> str:
+    return name.replace('_', '-').lower()
+
+
+class _JsonStream:
+    """
+    Minimal incremental reader for nested json objects.
+    Only the currently parsed value needs to fit into the buffer.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid repodata: expected '{char}' at '{self.buf[self.pos:self.pos + 20]}'")
+        self.pos += 1
+
+    def value(self, raw=False):
+        """
+        Decodes the next value. With `raw`, its json text is returned as well.
+        """
+        self.peek()
+        while True:
+            try:
+                val, end = self.decoder.raw_decode(self.buf, self.pos)
+            except JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # numbers and literals might be cut off at the end of the buffer
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            start, self.pos = self.pos, end
+            if raw:
+                return val, self.buf[start:end]
+            return val
+
+    def members(self) -> Iterator[str]:
+        """
+        Yields the keys of an object. The caller must consume each member's value before continuing.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+
+def iter_repodata_packages(file) -> Iterator[Tuple[str, dict, str]]:
+    """
+    Yields (fname, record, record_json) of the "packages" of a repodata file without loading the whole file
+    """
+    with open(file) as f:
+        stream = _JsonStream(f)
+        for key in stream.members():
+            if key in ('packages', 'packages.conda'):
+                for fname in stream.members():
+                    record, record_json = stream.value(raw=True)
+                    if key == 'packages':
+                        yield fname, record, record_json
+            else:
+                stream.value()
+
+
+def python_constraint(record):
+    """
+    Extracts the python dependencies of a conda build.
+    Returns None if it has none, False if it requires pypy and can never be used.
+    """
+    constraint = []
+    for dep in record.get('depends', ()):
+        if dep == "pypy" or dep.startswith("pypy "):
+            return False
+        if dep.startswith("python "):
+            constraint.append(dep)
+    return constraint or None
+
+
+@cached()
+def python_constraint_ok(constraint: Tuple[str], py_ver: Version) -> bool:
+    """
+    Memoized check of a build's python constraint, shared by all providers and target python versions
+    """
+    return all(next(iter(parse_reqs([dep]))).matcher.contains(py_ver) for dep in constraint)
+
+
+def build_index(repodata_file, out_file):
+    """
+    Streams the records of a repodata file into a packed DB file, keyed by normalized package name.
+    Records are buffered in a temporary file, only their offsets and lengths are held in memory.
+    """
+    offsets = defaultdict(lambda: array('Q'))
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(out_file))) as records:
+        for fname, record, record_json in iter_repodata_packages(repodata_file):
+            raw = f"[{json.dumps(fname)},{record_json},{json.dumps(python_constraint(record))}]".encode()
+            offsets[normalize_name(record['name'])].extend((records.tell(), len(raw)))
+            records.write(raw)
+
+        def items():
+            # the value of a name is the json list of its [fname, record, python_constraint] entries
+            for name, entries in offsets.items():
+                value = []
+                for i in range(0, len(entries), 2):
+                    records.seek(entries[i])
+                    value.append(records.read(entries[i + 1]))
+                yield name, b"[" + b",".join(value) + b"]"
+
+        pack_encoded(items(), out_file)
+
+
+def load_index(repodata_file) -> dict:
+    """
+    Like build_index, but loads the repodata file as a whole into an in-memory index
+    """
+    with open(repodata_file) as f:
+        packages = json.load(f).get('packages', {})
+    index = defaultdict(list)
+    for fname, record in packages.items():
+        index[normalize_name(record['name'])].append((fname, record, python_constraint(record)))
+    return dict(index)
+
+
+class CondaChannelIndex:
+    """
+    Package records of a conda channel, loaded per package name on first access.
+    Maps normalized name -> version -> build -> record, like the full repodata would.
+    """
+
+    def __init__(self, channel, files):
+        self.channel = channel
+        self._indexes: List[Mapping] = [self._open_index(file) for file in files]
+        self._loaded = {}
+
+    @staticmethod
+    def _index_file(directory, repodata_file) -> str:
+        key = f"{INDEX_FORMAT}:{file_fingerprint(repodata_file)}"
+        return f"{directory}/{hashlib.sha256(key.encode()).hexdigest()}{PACKED_EXT}"
+
+    def _open_index(self, repodata_file) -> Mapping:
+        directory = persistent_cache_dir('conda')
+        if directory is None:
+            return load_index(repodata_file)
+        index_file = self._index_file(directory, repodata_file)
+        if os.path.isfile(index_file):
+            try:
+                index = PackedDict(index_file)
+                os.utime(index_file)
+                return index
+            except (PackedDBError, OSError) as e:
+                print(f"WARNING: rebuilding conda index: {e}", file=sys.stderr)
+        try:
+            build_index(repodata_file, index_file)
+        except OSError as e:
+            print(f"WARNING: could not write conda index, loading {repodata_file} as a whole: {e}", file=sys.stderr)
+            return load_index(repodata_file)
+        prune_cache_dir(directory, PACKED_EXT, INDEX_KEEP)
+        return PackedDict(index_file)
+
+    def _load(self, name) -> dict:
+        pkg = {}
+        for index in self._indexes:
+            if name not in index:
+                continue
+            for fname, p, py_constraint in index[name]:
+                ver = p['version']
+                build = p['build']
+                if ver not in pkg:
+                    pkg[ver] = {}
+                if build in pkg[ver]:
+                    if 'collisions' not in pkg[ver][build]:
+                        pkg[ver][build]['collisions'] = []
+                    pkg[ver][build]['collisions'].append((p['name'], p['subdir']))
+                    continue
+                pkg[ver][build] = p
+                pkg[ver][build]['fname'] = fname
+                pkg[ver][build]['python_constraint'] = tuple(py_constraint) if py_constraint else py_constraint
+        return pkg
+
+    def __contains__(self, name):
+        return name in self._loaded or any(name in index for index in self._indexes)
+
+    def __getitem__(self, name) -> dict:
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        if name not in self:
+            raise KeyError(name)
+        pkg = self._loaded[name] = self._load(name)
+        return pkg
+
+    def __setitem__(self, name, pkg: dict):
+        self._loaded[name] = pkg
+
+
+_channel_indexes = {}
+
+
+def open_channel_index(channel, files) -> CondaChannelIndex:
+    """
+    Returns a shared index for the given repodata files of a channel
+    """
+    key = (channel, tuple(files))
+    if key not in _channel_indexes:
+        _channel_indexes[key] = CondaChannelIndex(channel, files)
+    return _channel_indexes[key]
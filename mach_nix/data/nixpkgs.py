@@ -1,11 +1,19 @@
+import hashlib
 import json
+import os
+import pickle
+import sys
 from collections import UserDict
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 import packaging.version
 
-from mach_nix.cache import cached
-from mach_nix.versions import parse_ver, Version
+from mach_nix.cache import cached, persistent_cache_dir, prune_cache_dir
+from mach_nix.fingerprint import file_fingerprint
+from mach_nix.versions import parse_ver, Version, version_key, version_table
+
+CACHE_FORMAT = 1
+CACHE_KEEP = 5
 
 
 @dataclass
@@ -22,10 +30,19 @@ class NixpkgsIndex(UserDict):
     )
 
     def __init__(self, nixpkgs_json_file, **kwargs):
+        cache_file = self._cache_file(nixpkgs_json_file)
+        if not (cache_file and self._load_cache(cache_file)):
+            self._parse(nixpkgs_json_file)
+            if cache_file:
+                self._save_cache(cache_file)
+        super(NixpkgsIndex, self).__init__(self.data, **kwargs)
+
+    def _parse(self, nixpkgs_json_file):
         with open(nixpkgs_json_file) as f:
             data = json.load(f)
         self.data = {}
         self.requirements = {}
+        self._raw_versions = {}
         for nix_key, nix_data in data.items():
             if nix_data is None:
                 continue
@@ -35,6 +52,7 @@ class NixpkgsIndex(UserDict):
             except packaging.version.InvalidVersion as e:
                 print("omitting nixpkgs / ", pname, " version was invalid: '", nix_data["version"], "'", sep="")
                 continue
+            self._raw_versions[nix_data["version"]] = version
             pname_key = pname.replace("_", "-").lower()
             if pname_key not in self.data:
                 self.data[pname_key] = {}
@@ -43,7 +61,53 @@ class NixpkgsIndex(UserDict):
             self.data[pname_key][version].append(nix_key)
             if nix_data["requirements"] is not None:
                 self.requirements[nix_key] = nix_data["requirements"]
-        super(NixpkgsIndex, self).__init__(self.data, **kwargs)
+
+    @staticmethod
+    def _cache_file(nixpkgs_json_file) -> Optional[str]:
+        """
+        The parsed index is cached across runs, keyed by the nixpkgs json file.
+        Pickled versions depend on the packaging library, therefore its version is part of the key.
+        """
+        directory = persistent_cache_dir('nixpkgs')
+        if directory is None:
+            return None
+        key = f"{CACHE_FORMAT}:{packaging.__version__}:{file_fingerprint(nixpkgs_json_file)}"
+        return f"{directory}/{hashlib.sha256(key.encode()).hexdigest()}.pickle"
+
+    def _load_cache(self, cache_file) -> bool:
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_index = pickle.load(f)
+            data, requirements, raw_versions = \
+                cached_index['data'], cached_index['requirements'], cached_index['versions']
+        except FileNotFoundError:
+            return False
+        # a corrupt or partially written cache can fail in many ways, it is rebuilt in any case
+        except Exception as e:
+            print(f"WARNING: rebuilding nixpkgs index cache {cache_file}: {type(e).__name__}: {e}", file=sys.stderr)
+            return False
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+        self.data = data
+        self.requirements = requirements
+        self._raw_versions = raw_versions
+        # later parses of the same version strings return the objects of the index
+        version_table.register(self._raw_versions)
+        return True
+
+    def _save_cache(self, cache_file):
+        tmp = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(
+                    dict(data=self.data, requirements=self.requirements, versions=self._raw_versions),
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_file)
+        except OSError:
+            return
+        prune_cache_dir(os.path.dirname(cache_file), '.pickle', CACHE_KEEP)
 
     def has_multiple_candidates(self, name):
         count = 0
@@ -63,7 +127,7 @@ class NixpkgsIndex(UserDict):
         # prioritizing similar names, reduces chance of infinite recursion
         # (see problem with dateutil alias)
         name_difference = lambda p: abs(len(p.name)-len(p.nix_key))
-        return max(pkgs, key=lambda p: (p.ver, -name_difference(p)))
+        return max(pkgs, key=lambda p: (version_key(p.ver), -name_difference(p)))
 
     @staticmethod
     def is_same_ver(ver1, ver2, prefix_len):
@@ -85,7 +149,7 @@ class NixpkgsIndex(UserDict):
         In case a python package has more than one candidate in nixpkgs
         like `django` and `django_2_2`, this algo will select the right one.
         """
-        pkgs: List[NixpkgsPyPkg] = sorted(self.get_all_candidates(name), key=lambda pkg: pkg.ver)
+        pkgs: List[NixpkgsPyPkg] = sorted(self.get_all_candidates(name), key=lambda pkg: version_key(pkg.ver))
         if len(pkgs) == 1:
             return pkgs[0].nix_key
         # try to find nixpkgs candidate with closest version
@@ -113,7 +177,8 @@ class NixpkgsIndex(UserDict):
         except KeyError:
             return False
         if ver:
-            return any(ver == c.ver for c in candidates)
+            ver_key = version_key(ver)
+            return any(ver_key == version_key(c.ver) for c in candidates)
         return True
 
     def get_requirements(self, name, ver):
@@ -0,0 +1,312 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping
+
+from mach_nix.fingerprint import dir_fingerprint
+from .bucket_dict import LazyBucketDict
+
+# On-disk layout of a packed DB file:
+#   header:  magic, format version, source digest (sha256 of the fingerprint of the data it was built from)
+#   table:   the top level table
+#
+# Layout of a table:
+#   count:   number of entries
+#   entries: one (key_offset, key_len, value_offset, value_len) tuple per key, in the order of the source dict
+#   index:   entry numbers sorted by key
+#   keys:    utf-8 encoded keys
+#   values:  compact json, or NESTED followed by another table
+# Offsets are relative to the start of the table. Lookups bisect the index,
+# so only the values which are actually accessed need to be decoded.
+# Iteration follows the entries, so packed records iterate in the same order as the json DB.
+# Nested tables allow decoding parts of a package record (eg. a single version of an sdist).
+
+MAGIC = b"MNDB"
+FORMAT_VERSION = 4
+PACKED_EXT = ".mndb"
+HEADER = struct.Struct("<4sHxx32s")
+NO_SOURCE = bytes(32)
+COUNT = struct.Struct("<Q")
+ENTRY = struct.Struct("<QIQI")
+INDEX = struct.Struct("<Q")
+NESTED = b"\x00"
+
+
+class PackedDBError(Exception):
+    pass
+
+
+class PackedTable(Mapping):
+    """
+    Read-only mapping over a table inside a memory mapped packed DB file.
+    Values are decoded on first access.
+    """
+
+    def __init__(self, buf, offset):
+        self._buf = buf
+        self._offset = offset
+        self._count = COUNT.unpack_from(buf, offset)[0]
+        self._entries_offset = offset + COUNT.size
+        self._index_offset = self._entries_offset + self._count * ENTRY.size
+        self._decoded = {}
+
+    def _entry(self, idx):
+        return ENTRY.unpack_from(self._buf, self._entries_offset + idx * ENTRY.size)
+
+    def _sorted_entry(self, pos):
+        """
+        returns the index of the entry at position `pos` in key order
+        """
+        return INDEX.unpack_from(self._buf, self._index_offset + pos * INDEX.size)[0]
+
+    def _key_at(self, idx) -> bytes:
+        key_offset, key_len, _, _ = self._entry(idx)
+        start = self._offset + key_offset
+        return self._buf[start:start + key_len]
+
+    def _find(self, key: str):
+        """
+        returns the index of the entry for `key` or None
+        """
+        key = key.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(self._sorted_entry(mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            idx = self._sorted_entry(lo)
+            if self._key_at(idx) == key:
+                return idx
+        return None
+
+    def _read_value(self, idx):
+        _, _, val_offset, val_len = self._entry(idx)
+        start = self._offset + val_offset
+        if self._buf[start:start + 1] == NESTED:
+            return PackedTable(self._buf, start + 1)
+        return json.loads(self._buf[start:start + val_len])
+
+    def __getitem__(self, key):
+        if key in self._decoded:
+            return self._decoded[key]
+        idx = self._find(key)
+        if idx is None:
+            raise KeyError(key)
+        value = self._decoded[key] = self._read_value(idx)
+        return value
+
+    def __contains__(self, key):
+        return key in self._decoded or self._find(key) is not None
+
+    def __iter__(self):
+        for idx in range(self._count):
+            yield self._key_at(idx).decode()
+
+    def items(self):
+        for key in self:
+            yield key, self[key]
+
+    def __len__(self):
+        return self._count
+
+
+class PackedDict(PackedTable):
+    """
+    Read-only mapping over a packed DB file.
+    Drop-in replacement for LazyBucketDict where the data is only read.
+    The file is memory mapped, so concurrent processes share the same pages.
+    If `source` is given, the file must have been built from data with that digest (see source_digest).
+    """
+
+    def __init__(self, file, source: bytes = None):
+        self.file = file
+        with open(file, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, file_source = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise PackedDBError(f"{file} is not a packed DB file")
+        if version != FORMAT_VERSION:
+            raise PackedDBError(f"{file} has format version {version}, expected {FORMAT_VERSION}")
+        if source is not None and file_source != source:
+            raise PackedDBError(f"{file} was built from different data")
+        super().__init__(buf, HEADER.size)
+
+    def prefetch(self, keys):
+        """
+        Asks the kernel to read the records of `keys` in the background.
+        Records are still decoded on access, which is cheap compared to reading them from disk.
+        """
+        if not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        for key in keys:
+            idx = self._find(key)
+            if idx is None:
+                continue
+            _, _, val_offset, val_len = self._entry(idx)
+            start = self._offset + val_offset
+            page_start = start - start % mmap.PAGESIZE
+            self._buf.madvise(mmap.MADV_WILLNEED, page_start, start + val_len - page_start)
+
+
+def encode_value(val, nested: int) -> bytes:
+    if nested > 0 and isinstance(val, dict):
+        return NESTED + encode_table(((k, encode_value(v, nested - 1)) for k, v in val.items()))
+    return json.dumps(val, separators=(',', ':')).encode()
+
+
+def encode_index(keys) -> bytes:
+    """
+    Encodes the entry numbers of `keys` (utf-8 encoded, in entry order) sorted by key
+    """
+    return b"".join(INDEX.pack(idx) for idx in sorted(range(len(keys)), key=keys.__getitem__))
+
+
+def encode_table(items) -> bytes:
+    """
+    Encodes (key, encoded_value) pairs into a table, keeping their order
+    """
+    items = [(key.encode(), val) for key, val in items]
+    keys = [key for key, _ in items]
+    keys_offset = COUNT.size + len(items) * (ENTRY.size + INDEX.size)
+    values_offset = keys_offset + sum(map(len, keys))
+    entries, key_offset, val_offset = [], keys_offset, values_offset
+    for key, val in items:
+        entries.append(ENTRY.pack(key_offset, len(key), val_offset, len(val)))
+        key_offset += len(key)
+        val_offset += len(val)
+    return b"".join((COUNT.pack(len(items)), *entries, encode_index(keys), *keys, *(val for _, val in items)))
+
+
+def source_digest(data_dir, salt="") -> bytes:
+    """
+    Identifies the data a packed DB is built from. `salt` can be used to distinguish different builds of the same data.
+    """
+    return hashlib.sha256(f"{salt}{dir_fingerprint(data_dir)}".encode()).digest()
+
+
+def pack(items, out_file, nested=1, source=NO_SOURCE):
+    """
+    Writes the (key, value) pairs of `items` to `out_file` in the packed DB format.
+    Dict values are stored as nested tables down to the depth given by `nested`.
+    Values are streamed to a temporary file, so only the keys are held in memory.
+    """
+    pack_encoded(((key, encode_value(val, nested)) for key, val in items), out_file, source)
+
+
+def pack_encoded(items, out_file, source=NO_SOURCE):
+    """
+    Like pack(), but takes (key, encoded_value) pairs
+    """
+    entries = []
+    out_dir = os.path.dirname(os.path.abspath(out_file))
+    with tempfile.TemporaryFile(dir=out_dir) as values:
+        for key, val_raw in items:
+            entries.append((key.encode(), values.tell(), len(val_raw)))
+            values.write(val_raw)
+        keys_offset = COUNT.size + len(entries) * (ENTRY.size + INDEX.size)
+        values_offset = keys_offset + sum(len(e[0]) for e in entries)
+        tmp_out = f"{out_file}.tmp"
+        with open(tmp_out, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, source))
+            f.write(COUNT.pack(len(entries)))
+            key_offset = keys_offset
+            for key, val_offset, val_len in entries:
+                f.write(ENTRY.pack(key_offset, len(key), values_offset + val_offset, val_len))
+                key_offset += len(key)
+            f.write(encode_index([key for key, _, _ in entries]))
+            for key, _, _ in entries:
+                f.write(key)
+            values.seek(0)
+            while True:
+                chunk = values.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.replace(tmp_out, out_file)
+
+
+def pack_bucket_dir(directory, out_file):
+    """
+    Converts a directory of json buckets (as used by LazyBucketDict) into a packed DB file
+    """
+    data = LazyBucketDict(directory)
+    source = source_digest(directory)
+
+    def items():
+        for bucket in LazyBucketDict.bucket_keys():
+            for key, val in data.by_bucket(bucket).items():
+                yield key, val
+            # free memory of buckets which are already written
+            del data.data[bucket]
+
+    pack(items(), out_file, source=source)
+
+
+_open_dbs = {}
+
+
+def open_packed(data_dir, suffix="", salt=""):
+    """
+    Returns the packed DB file `<data_dir><suffix>.mndb` (or `<name><suffix>.mndb` inside
+    MACHNIX_PACKED_DB_DIR) if it exists and was built from the current content of `data_dir`, otherwise None.
+    """
+    name = os.path.basename(os.path.normpath(data_dir))
+    candidates = [f"{os.path.normpath(data_dir)}{suffix}{PACKED_EXT}"]
+    packed_dir = os.environ.get("MACHNIX_PACKED_DB_DIR")
+    if packed_dir:
+        candidates.insert(0, f"{packed_dir}/{name}{suffix}{PACKED_EXT}")
+    source = None
+    for file in candidates:
+        if os.path.isfile(file):
+            if source is None:
+                source = source_digest(data_dir, salt)
+            key = (os.path.realpath(file), os.stat(file).st_mtime_ns, source)
+            if key in _open_dbs:
+                return _open_dbs[key]
+            try:
+                db = _open_dbs[key] = PackedDict(file, source)
+                return db
+            # empty or truncated files fail in mmap or when unpacking the header
+            except (PackedDBError, ValueError, struct.error, OSError) as e:
+                print(f"WARNING: ignoring packed DB: {e}", file=sys.stderr)
+    return None
+
+
+def open_db(data_dir):
+    """
+    Returns a packed DB for `data_dir` if one has been built, otherwise the json buckets.
+    The packed file is looked up next to `data_dir` (eg. `<db>/sdist.mndb` for `<db>/sdist`)
+    and in the directory specified via MACHNIX_PACKED_DB_DIR.
+    Opened DBs are shared, so providers for different targets don't load the same data twice.
+    """
+    packed = open_packed(data_dir)
+    if packed is not None:
+        return packed
+    key = os.path.realpath(data_dir)
+    if key not in _open_dbs:
+        _open_dbs[key] = LazyBucketDict(data_dir)
+    return _open_dbs[key]
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("usage: python -m mach_nix.data.packed_db <pypi_deps_db_src> [out_dir]", file=sys.stderr)
+        exit(1)
+    src = sys.argv[1]
+    out_dir = sys.argv[2] if len(sys.argv) == 3 else src
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ('sdist', 'wheel'):
+        out_file = f"{out_dir}/{name}{PACKED_EXT}"
+        print(f"packing {src}/{name} into {out_file}")
+        pack_bucket_dir(f"{src}/{name}", out_file)
+
+
+if __name__ == "__main__":
+    main()
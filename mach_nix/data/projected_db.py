@@ -0,0 +1,99 @@
+import os
+import sys
+
+from mach_nix.fingerprint import code_fingerprint
+from mach_nix.versions import PyVer
+from .bucket_dict import LazyBucketDict
+from .packed_db import open_packed, pack, source_digest, PACKED_EXT
+
+# A projected DB is a view of the sdist or wheel DB for a single target (python version, platform, system).
+# It only contains releases which are compatible to the target, with all references already resolved:
+#   sdist:  name -> {version: release}, python_requires already applied
+#   wheel:  name -> [[fn_pyver, ver, fn, requires_dist, requires_extras, requires_python, requires_dist_parsed], ...]
+#           only wheels with a compatible tag and python_requires
+# Projections are stored in the packed DB format next to the DB they are built from
+# (eg. `<db>/sdist-py3.9.5-x86_64-linux.mndb`), or in MACHNIX_PACKED_DB_DIR.
+# The providers use them instead of the full DB if one exists for their target.
+# A projection is only used if it was built from the current DB, by the same projection format and mach-nix code.
+
+PROJECTION_FORMAT = 1
+
+
+def projection_target(py_ver: PyVer, platform, system) -> str:
+    # the full python version is needed, since python_requires can restrict bugfix versions
+    return f"py{py_ver.version}-{platform}-{system}"
+
+
+def projection_salt(target) -> str:
+    return f"projection:{PROJECTION_FORMAT}:{code_fingerprint()}:{target}:"
+
+
+def open_projected_db(data_dir, py_ver: PyVer, platform, system):
+    """
+    Returns the projected view of `data_dir` for the given target if an up to date one has been built, otherwise None.
+    """
+    target = projection_target(py_ver, platform, system)
+    return open_packed(data_dir, f"-{target}", projection_salt(target))
+
+
+def _names(data):
+    """
+    Yields all package names of `data`. Records which have been yielded are dropped afterwards,
+    so the whole DB is never held in memory.
+    """
+    if isinstance(data, LazyBucketDict):
+        for bucket in LazyBucketDict.bucket_keys():
+            yield from list(data.by_bucket(bucket))
+            del data.data[bucket]
+    else:
+        for name in data:
+            yield name
+            data._decoded.pop(name, None)
+
+
+def project_sdist(provider):
+    """
+    Yields (name, {version: release}) for all packages of the sdist provider's DB
+    """
+    for name in _names(provider.data):
+        # skip the cache of _get_candidates, which would otherwise end up holding the whole DB
+        candidates = type(provider)._get_candidates.__wrapped__(provider, name)
+        if candidates:
+            yield name, candidates
+
+
+def project_wheel(provider):
+    """
+    Yields (name, [release, ...]) for all packages of the wheel provider's DB
+    """
+    for name in _names(provider.data):
+        releases = [[w.fn_pyver, *w[2:]] for w in provider._suitable_wheels(name)]
+        if releases:
+            yield name, releases
+
+
+def project(pypi_deps_db_src, py_ver: PyVer, platform, system, out_dir):
+    from .providers import SdistDependencyProvider, WheelDependencyProvider
+    target = projection_target(py_ver, platform, system)
+    for provider_cls, projector in ((SdistDependencyProvider, project_sdist), (WheelDependencyProvider, project_wheel)):
+        data_dir = f"{pypi_deps_db_src}/{provider_cls.name}"
+        out_file = f"{out_dir}/{provider_cls.name}-{target}{PACKED_EXT}"
+        print(f"projecting {data_dir} into {out_file}")
+        provider = provider_cls(data_dir, py_ver=py_ver, platform=platform, system=system, use_projection=False)
+        pack(projector(provider), out_file, nested=0, source=source_digest(data_dir, projection_salt(target)))
+
+
+def main():
+    if len(sys.argv) not in (4, 5):
+        print("usage: python -m mach_nix.data.projected_db <pypi_deps_db_src> <py_ver> <system> [out_dir]\n"
+              "  eg. python -m mach_nix.data.projected_db ./pypi-deps-db 3.9.5 x86_64-linux", file=sys.stderr)
+        exit(1)
+    src, py_ver_str, system = sys.argv[1:4]
+    out_dir = sys.argv[4] if len(sys.argv) == 5 else src
+    os.makedirs(out_dir, exist_ok=True)
+    platform, system_name = system.split('-')
+    project(src, PyVer(py_ver_str), platform, system_name, out_dir)
+
+
+if __name__ == "__main__":
+    main()
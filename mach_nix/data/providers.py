@@ -3,26 +3,29 @@ from os import environ
 
 import json
 import platform
-import re
 import sys
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
 from operator import itemgetter
-from typing import Any, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 
-import distlib.markers
-from pkg_resources import RequirementParseError
 import packaging
-
-from mach_nix.requirements import filter_reqs_by_eval_marker, Requirement, parse_reqs, context, filter_versions
-from mach_nix.versions import PyVer, parse_ver, Version
-from .bucket_dict import LazyBucketDict
+from packaging.specifiers import InvalidSpecifier
+
+from mach_nix.requirements import filter_reqs_by_eval_marker, Requirement, parse_reqs, context, filter_versions, \
+    parse_reqs_preparsed, eval_marker, MarkerContext
+from mach_nix.specifiers import SortedVersions
+from mach_nix.versions import PyVer, parse_ver, Version, version_key
+from .conda_index import open_channel_index, python_constraint_ok
+from .packed_db import open_db
+from .projected_db import open_projected_db
 from .nixpkgs import NixpkgsIndex
+from .wheel_tags import WheelTagPriorities
 from ..cache import cached
 
 
-@dataclass
-class Candidate:
+# Candidates, their provider infos and wheel releases are created for every release of every
+# inspected package. Named tuples keep them compact (no per-instance __dict__) and immutable.
+class Candidate(NamedTuple):
     name: str
     ver: Version
     raw_version: str
@@ -30,9 +33,25 @@ class Candidate:
     provider_info: 'ProviderInfo'
     build: str = None
 
+    @property
+    def key(self):
+        """
+        Identity of the candidate. Unlike the fields, it doesn't include the provider's data, so it's cheap to compare.
+        """
+        pi = self.provider_info
+        return pi.provider, self.name, self.raw_version, self.build, pi.wheel_fname, self.selected_extras
 
-@dataclass
-class ProviderInfo:
+    def __eq__(self, other):
+        return isinstance(other, Candidate) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class ProviderInfo(NamedTuple):
     provider: 'DependencyProviderBase'
     wheel_fname: str = None  # only required for wheel
     url: str = None
@@ -92,8 +111,7 @@ class PackageNotFound(Exception):
 class DependencyProviderBase(ABC):
     def __init__(self, py_ver: PyVer, platform, system, *args, **kwargs):
         self.context = context(py_ver, platform, system)
-        self.context_wheel = self.context.copy()
-        self.context_wheel['extra'] = None
+        self.context_wheel = MarkerContext(self.context, extra=None)
         self.py_ver = py_ver
         self.py_ver_digits = py_ver.digits()
         self.platform = platform
@@ -103,17 +121,67 @@ class DependencyProviderBase(ABC):
     def find_matches(self, reqs) -> List[Candidate]:
         extras = tuple({extra for req in reqs for extra in req.extras})
         builds = tuple({req.build for req in reqs if req.build is not None})
-        all = list(self.all_candidates_sorted(reqs[0].key, extras, builds))
-        matching_versions = [c.ver for c in all]
-        for req in reqs:
-            matching_versions = filter_versions(matching_versions, req)
-        matching_versions = set(matching_versions)
-        matching_candidates = [c for c in all if c.ver in matching_versions]
-        return matching_candidates
+        _, groups = self._sorted_candidates(reqs[0].key, extras, builds)
+        matching = self._matching_indices(reqs[0].key, extras, builds, tuple(reqs))
+        return [c for i in sorted(matching, reverse=True) for c in groups[i]]
+
+    def iter_matches(self, reqs) -> Iterator[Candidate]:
+        """
+        Like find_matches, but providers combining other providers only load those on demand
+        """
+        return iter(self.find_matches(reqs))
+
+    def count_matches(self, reqs) -> int:
+        """
+        Number of candidates find_matches returns, without building the list of candidates
+        """
+        extras = tuple({extra for req in reqs for extra in req.extras})
+        builds = tuple({req.build for req in reqs if req.build is not None})
+        _, groups = self._sorted_candidates(reqs[0].key, extras, builds)
+        return sum(len(groups[i]) for i in self._matching_indices(reqs[0].key, extras, builds, tuple(reqs)))
+
+    @cached()
+    def _matching_indices(self, name, extras, builds, reqs: tuple) -> Set[int]:
+        """
+        Indices of the sorted versions matching all `reqs`, narrowed down requirement by requirement.
+        The resolver adds requirements one at a time, so the result for all but the last one is usually cached
+        and only the new requirement needs to be applied.
+        """
+        subset = self._matching_indices(name, extras, builds, reqs[:-1]) if len(reqs) > 1 else None
+        return reqs[-1].matcher.filter_indices(self._sorted_versions(name, extras, builds), subset)
+
+    def candidates_for_version(self, name, ver: Version) -> List[Candidate]:
+        """
+        Candidates (without extras) of the given package version, in the order of all_candidates
+        """
+        return self._version_index(name).get(version_key(ver), [])
+
+    @cached()
+    def _version_index(self, name) -> Dict[tuple, List[Candidate]]:
+        index = {}
+        for c in self.all_candidates(name, None, None):
+            index.setdefault(version_key(c.ver), []).append(c)
+        return index
+
+    @cached()
+    def _sorted_candidates(self, name, extras, builds) -> Tuple[SortedVersions, List[List[Candidate]]]:
+        """
+        The sorted versions of all candidates, plus the candidates grouped by the index of their version.
+        Groups keep the order of all_candidates_sorted.
+        """
+        candidates = self.all_candidates_sorted(name, extras, builds)
+        versions = SortedVersions(c.ver for c in candidates)
+        groups = [[] for _ in range(len(versions))]
+        for c in candidates:
+            groups[versions.index[c.ver]].append(c)
+        return versions, groups
+
+    def _sorted_versions(self, name, extras, builds) -> SortedVersions:
+        return self._sorted_candidates(name, extras, builds)[0]
 
     def all_candidates_sorted(self, name, extras, builds) -> Iterable[Candidate]:
         candidates = list(self.all_candidates(name, extras, builds))
-        candidates.sort(key=lambda c: c.ver, reverse=True)
+        candidates.sort(key=lambda c: version_key(c.ver), reverse=True)
         return candidates
 
     @property
@@ -121,6 +189,12 @@ class DependencyProviderBase(ABC):
     def name(self):
         pass
 
+    def prefetch(self, pkg_names: Iterable[str]):
+        """
+        Starts loading the data of packages which are likely needed later. Returns immediately.
+        """
+        pass
+
     def unify_key(self, key: str) -> str:
         return key.replace('_', '-').lower()
 
@@ -172,6 +246,11 @@ class CombinedDependencyProvider(DependencyProviderBase):
         if unknown_providers:
             raise Exception(f"Error: Unknown providers '{unknown_providers}'. Please remove from 'providers=...'")
 
+    def prefetch(self, pkg_names: Iterable[str]):
+        pkg_names = list(pkg_names)
+        for provider in self._all_providers.values():
+            provider.prefetch(pkg_names)
+
     def allowed_providers_for_pkg(self, pkg_name):
         provider_keys = self.provider_settings.provider_names_for_pkg(pkg_name)
         selected_providers = ((name, p) for name, p in self._all_providers.items() if name in provider_keys)
@@ -222,6 +301,54 @@ class CombinedDependencyProvider(DependencyProviderBase):
     def all_candidates(self, name, extras, builds) -> Iterable[Candidate]:
         return self.all_candidates_sorted(name, extras, builds)
 
+    @cached(keyfunc=lambda args: (args[0], tuple(args[1])))
+    def find_matches(self, reqs) -> List[Candidate]:
+        return list(self.iter_matches(reqs))
+
+    @staticmethod
+    def _matched_per_provider(reqs) -> bool:
+        # Requirements with specifiers match each version on its own, so matching the providers one by one
+        # gives the same result. A requirement without specifiers only allows pre-releases if no final release
+        # matches, which has to be decided on the versions of all providers.
+        return all(req.specs for req in reqs)
+
+    def count_matches(self, reqs) -> int:
+        if not self._matched_per_provider(reqs):
+            return len(self.find_matches(reqs))
+        providers = self.allowed_providers_for_pkg(reqs[0].key).values()
+        return sum(provider.count_matches(reqs) for provider in providers)
+
+    def iter_matches(self, reqs) -> Iterator[Candidate]:
+        """
+        Yields the matching candidates of the allowed providers in order of preference.
+        If the versions can be matched per provider, the candidates of a provider are only loaded
+        once the ones of the previous provider are consumed.
+        """
+        if not self._matched_per_provider(reqs):
+            yield from self._match_all_providers(reqs)
+            return
+        providers = tuple(self.allowed_providers_for_pkg(reqs[0].key).values())
+        found = False
+        for provider in providers:
+            for candidate in provider.find_matches(reqs):
+                found = True
+                yield candidate
+        if not found:
+            extras = tuple({extra for req in reqs for extra in req.extras})
+            builds = tuple({req.build for req in reqs if req.build is not None})
+            if not any(provider.all_candidates_sorted(reqs[0].key, extras, builds) for provider in providers):
+                self.print_error_no_versions_available(reqs[0].key, extras, builds)
+
+    def _match_all_providers(self, reqs) -> List[Candidate]:
+        """
+        Matches the versions of all allowed providers at once, keeping the order of all_candidates_sorted
+        """
+        extras = tuple({extra for req in reqs for extra in req.extras})
+        builds = tuple({req.build for req in reqs if req.build is not None})
+        versions = self._sorted_versions(reqs[0].key, extras, builds)
+        matching = {versions.versions[i] for i in self._matching_indices(reqs[0].key, extras, builds, tuple(reqs))}
+        return [c for c in self.all_candidates_sorted(reqs[0].key, extras, builds) if c.ver in matching]
+
 
 class NixpkgsDependencyProvider(DependencyProviderBase):
     name = 'nixpkgs'
@@ -244,12 +371,8 @@ class NixpkgsDependencyProvider(DependencyProviderBase):
             return list(parse_reqs(requirements)), None
 
         for provider in (self.sdist_provider, self.wheel_provider):
-            candidates = [
-                candidate
-                for candidate in provider.all_candidates(c.name, None, None)
-                if candidate.ver == c.ver
-            ]
-            if len(candidates) > 0:
+            candidates = provider.candidates_for_version(c.name, c.ver)
+            if candidates:
                 return provider.get_pkg_reqs(candidates[0])
         return None, None
 
@@ -268,8 +391,7 @@ class NixpkgsDependencyProvider(DependencyProviderBase):
         ) for p in self.nixpkgs.get_all_candidates(name)]
 
 
-@dataclass
-class WheelRelease:
+class WheelRelease(NamedTuple):
     fn_pyver: str  # the python version indicated by the filename
     name: str
     ver: str
@@ -277,6 +399,7 @@ class WheelRelease:
     requires_dist: list
     provided_extras: list
     requires_python: str  # the python version of the wheel metadata
+    requires_dist_parsed: list = None  # pre-parsed requires_dist, see parse_reqs_preparsed
 
     def __hash__(self):
         return hash(self.fn)
@@ -284,32 +407,17 @@ class WheelRelease:
 
 class WheelDependencyProvider(DependencyProviderBase):
     name = 'wheel'
-    def __init__(self, data_dir: str, *args, **kwargs):
+    def __init__(self, data_dir: str, *args, use_projection=True, **kwargs):
         super(WheelDependencyProvider, self).__init__(*args, **kwargs)
-        self.data = LazyBucketDict(data_dir)
-        maj = self.py_ver.version.release[0]  # major version
-        min = self.py_ver.version.release[1]  # minor version
-        cp_abi = f"cp{maj}{min}mu" if int(maj) == 2 else f"cp{maj}{min}m?"
-        if self.system == "linux":
-            self.preferred_wheels = (
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-manylinux2014_{self.platform}"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-manylinux2010_{self.platform}"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-manylinux1_{self.platform}"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-manylinux_2_5_{self.platform}"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-manylinux_2_12_{self.platform}"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-manylinux_2_17_{self.platform}"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-linux_{self.platform}"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-any"),
-            )
-        elif self.system == "darwin":
-            platform = "arm64" if self.platform == "aarch64" else self.platform
-            self.preferred_wheels = (
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-any"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-macosx_\d*_\d*_universal"),
-                re.compile(rf".*(py{maj}|cp{maj})({min})?[\.-].*({cp_abi}|abi3|none)-macosx_\d*_\d*_{platform}"),
-            )
-        else:
-            raise Exception(f"Unsupported Platform {platform.system()}")
+        self.data = open_db(data_dir)
+        self.projected = None
+        if use_projection:
+            self.projected = open_projected_db(data_dir, self.py_ver, self.platform, self.system)
+        self.wheel_tags = WheelTagPriorities(self.py_ver, self.platform, self.system)
+
+    def prefetch(self, pkg_names: Iterable[str]):
+        data = self.data if self.projected is None else self.projected
+        data.prefetch(self.unify_key(name) for name in pkg_names)
 
     def all_candidates(self, pkg_name, extras, builds) -> List[Candidate]:
         if builds:
@@ -337,7 +445,8 @@ class WheelDependencyProvider(DependencyProviderBase):
         if reqs_raw is None:
             reqs_raw = []
         # handle extras by evaluationg markers
-        install_reqs = list(filter_reqs_by_eval_marker(parse_reqs(reqs_raw), self.context_wheel, c.selected_extras))
+        reqs = parse_reqs_preparsed(reqs_raw, c.provider_info.data.requires_dist_parsed)
+        install_reqs = list(filter_reqs_by_eval_marker(reqs, self.context_wheel, c.selected_extras))
         return install_reqs, []
 
     def _all_releases(self, pkg_name):
@@ -360,6 +469,7 @@ class WheelDependencyProvider(DependencyProviderBase):
                         deps['requires_dist'] if 'requires_dist' in deps else None,
                         deps['requires_extras'] if 'requires_extras' in deps else None,
                         deps['requires_python'].strip(',') if 'requires_python' in deps else None,
+                        deps.get('requires_dist_parsed'),
                     )
 
     def _apply_filters(self, filters: List[callable], objects: Iterable):
@@ -373,15 +483,17 @@ class WheelDependencyProvider(DependencyProviderBase):
 
     @cached()
     def _choose_wheel(self, pkg_name, pkg_version: Version) -> WheelRelease:
-        suitable = list(self._suitable_wheels(pkg_name, pkg_version))
+        suitable = [c.provider_info.data for c in self.candidates_for_version(pkg_name, pkg_version)]
         if not suitable:
             raise PackageNotFound(pkg_name, pkg_version, self.name)
         return self._select_preferred_wheel(suitable)
 
-    def _suitable_wheels(self, pkg_name: str, ver: Version = None) -> Iterable[WheelRelease]:
+    def _suitable_wheels(self, pkg_name: str) -> Iterable[WheelRelease]:
+        if self.projected is not None:
+            # the projection only contains suitable wheels
+            name = self.unify_key(pkg_name)
+            return [WheelRelease(fn_pyver, name, *rest) for fn_pyver, *rest in self.projected.get(name, ())]
         wheels = self._all_releases(pkg_name)
-        if ver is not None:
-            wheels = filter(lambda w: parse_ver(w.ver) == ver, wheels)
         return self._apply_filters(
             [
                 self._wheel_type_ok,
@@ -390,15 +502,15 @@ class WheelDependencyProvider(DependencyProviderBase):
             wheels)
 
     def _select_preferred_wheel(self, wheels: Iterable[WheelRelease]):
-        wheels = list(wheels)
-        for pattern in self.preferred_wheels:
-            for wheel in wheels:
-                if re.search(pattern, wheel.fn):
-                    return wheel
-        raise Exception(f"No wheel type found that is compatible to the current system")
+        prio = self.wheel_tags.priority
+        wheels = [w for w in wheels if prio(w.fn) is not None]
+        if not wheels:
+            raise Exception(f"No wheel type found that is compatible to the current system")
+        # min() returns the first of equally preferred wheels
+        return min(wheels, key=lambda w: prio(w.fn))
 
     def _wheel_type_ok(self, wheel: WheelRelease):
-        return any(re.search(pattern, wheel.fn) for pattern in self.preferred_wheels)
+        return self.wheel_tags.priority(wheel.fn) is not None
 
     def _python_requires_ok(self, wheel: WheelRelease):
         if not wheel.requires_python:
@@ -407,7 +519,7 @@ class WheelDependencyProvider(DependencyProviderBase):
         try:
             parsed_py_requires = list(parse_reqs(f"python{wheel.requires_python}"))
             return bool(filter_versions([ver], parsed_py_requires[0]))
-        except RequirementParseError:
+        except InvalidSpecifier:
             print(f"WARNING: `requires_python` attribute of wheel {wheel.name}:{wheel.ver} could not be parsed")
             return False
 
@@ -415,9 +527,16 @@ class WheelDependencyProvider(DependencyProviderBase):
 class SdistDependencyProvider(DependencyProviderBase):
     name = 'sdist'
 
-    def __init__(self, data_dir: str, *args, **kwargs):
-        self.data = LazyBucketDict(data_dir)
+    def __init__(self, data_dir: str, *args, use_projection=True, **kwargs):
+        self.data = open_db(data_dir)
         super(SdistDependencyProvider, self).__init__(*args, **kwargs)
+        self.projected = None
+        if use_projection:
+            self.projected = open_projected_db(data_dir, self.py_ver, self.platform, self.system)
+
+    def prefetch(self, pkg_names: Iterable[str]):
+        data = self.data if self.projected is None else self.projected
+        data.prefetch(self.unify_key(name) for name in pkg_names)
 
     @cached()
     def _get_candidates(self, name) -> dict:
@@ -425,6 +544,9 @@ class SdistDependencyProvider(DependencyProviderBase):
         returns all candidates for the give name which are available for the current python version
         """
         key = self.unify_key(name)
+        if self.projected is not None:
+            # references are already resolved and python_requires applied
+            return self.projected.get(key, {})
         candidates = {}
         try:
             self.data[key]
@@ -458,14 +580,17 @@ class SdistDependencyProvider(DependencyProviderBase):
         extras = set(extras)
         requirements = []
         if 'extras_require' in pkg:
+            parsed = pkg.get('extras_require_parsed', {})
             for name, reqs_str in pkg['extras_require'].items():
+                key = name
                 # handle extras with marker in key
                 if ':' in name:
                     name, marker = name.split(':')
-                    if not distlib.markers.interpret(marker, self.context):
+                    if not eval_marker(marker, self.context):
                         continue
                 if name == '' or name in extras:
-                    requirements += list(filter_reqs_by_eval_marker(parse_reqs(reqs_str), self.context))
+                    reqs = parse_reqs_preparsed(reqs_str, parsed.get(key))
+                    requirements += list(filter_reqs_by_eval_marker(reqs, self.context))
         return requirements
 
     def get_pkg_reqs(self, c: Candidate) -> Tuple[List[Requirement], List[Requirement]]:
@@ -481,8 +606,7 @@ class SdistDependencyProvider(DependencyProviderBase):
             if t not in pkg:
                 requirements[t] = []
             else:
-                reqs_raw = pkg[t]
-                reqs = parse_reqs(reqs_raw)
+                reqs = parse_reqs_preparsed(pkg[t], pkg.get(f"{t}_parsed"))
                 requirements[t] = list(filter_reqs_by_eval_marker(reqs, self.context))
         # even if no extras are selected we need to collect reqs for extras,
         # because some extras consist of only a marker which needs to be evaluated
@@ -544,26 +668,7 @@ class CondaDependencyProvider(DependencyProviderBase):
 
     def __init__(self, channel, files, py_ver: PyVer, platform, system, *args, **kwargs):
         self.channel = channel
-        self.pkgs = {}
-        for file in files:
-            with open(file) as f:
-                content = json.load(f)
-            for i, fname in enumerate(content['packages'].keys()):
-                p = content['packages'][fname]
-                name = p['name'].replace('_', '-').lower()
-                ver = p['version']
-                build = p['build']
-                if name not in self.pkgs:
-                    self.pkgs[name] = {}
-                if ver not in self.pkgs[name]:
-                    self.pkgs[name][ver] = {}
-                if build in self.pkgs[name][ver]:
-                    if 'collisions' not in self.pkgs[name][ver][build]:
-                        self.pkgs[name][ver][build]['collisions'] = []
-                    self.pkgs[name][ver][build]['collisions'].append((p['name'], p['subdir']))
-                    continue
-                self.pkgs[name][ver][build] = p
-                self.pkgs[name][ver][build]['fname'] = fname
+        self.pkgs = open_channel_index(channel, files)
 
         # generate packages for virtual packages
         for pname, ver in self.virtual_packages.items():
@@ -600,7 +705,7 @@ class CondaDependencyProvider(DependencyProviderBase):
     def all_candidates_sorted(self, name, extras, build) -> Iterable[Candidate]:
         candidates = self.all_candidates(name, extras, build)
         candidates.sort(
-            key=lambda c: (c.ver, c.provider_info.data["build_number"]),
+            key=lambda c: (version_key(c.ver), c.provider_info.data["build_number"]),
             reverse=True,
         )
         return candidates
@@ -648,14 +753,13 @@ class CondaDependencyProvider(DependencyProviderBase):
         return candidates
 
     def python_ok(self, build):
-        for dep in build['depends']:
-            if dep == "pypy" or dep.startswith("pypy "):
-                return False
-            if dep.startswith("python "):
-                req = next(iter(parse_reqs([dep])))
-                if not filter_versions([self.py_ver.version], req):
-                    return False
-        return True
+        # the python constraint of each build is extracted when indexing the channel
+        constraint = build.get('python_constraint')
+        if constraint is False:
+            return False
+        if not constraint:
+            return True
+        return python_constraint_ok(constraint, self.py_ver.version)
 
     @cached()
     def compatible_builds(self, pkg_name, build_patterns) -> list:
@@ -0,0 +1,83 @@
+import re
+from typing import Optional, Tuple
+
+from mach_nix.versions import PyVer
+
+
+def parse_wheel_fn(fn: str) -> Optional[Tuple[Tuple[str], Tuple[str], Tuple[str]]]:
+    """
+    Splits a wheel filename into its (python tags, abi tags, platform tags).
+    Compressed tag sets like `py2.py3` are split into their single tags.
+    Returns None if `fn` isn't a valid wheel filename.
+    """
+    if not fn.endswith('.whl'):
+        return None
+    parts = fn[:-4].rsplit('-', 3)
+    if len(parts) != 4:
+        return None
+    _, py_tags, abi_tags, platform_tags = parts
+    return tuple(py_tags.split('.')), tuple(abi_tags.split('.')), tuple(platform_tags.split('.'))
+
+
+class WheelTagPriorities:
+    """
+    Compatibility table of wheel tags for a target python version and system.
+    `priority()` returns the preference of a wheel (lower is better) or None if it is incompatible.
+    Results are memoized per filename, so repeated checks of the same wheel are dict lookups.
+    """
+
+    def __init__(self, py_ver: PyVer, platform: str, system: str):
+        maj = py_ver.version.release[0]  # major version
+        min = py_ver.version.release[1]  # minor version
+        self.py_tags = {f"py{maj}", f"py{maj}{min}", f"cp{maj}", f"cp{maj}{min}"}
+        if int(maj) == 2:
+            self.abi_tags = {f"cp{maj}{min}mu", "abi3", "none"}
+        else:
+            self.abi_tags = {f"cp{maj}{min}", f"cp{maj}{min}m", "abi3", "none"}
+        if system == "linux":
+            self.platform_patterns = tuple(re.compile(re.escape(tag)) for tag in (
+                f"manylinux2014_{platform}",
+                f"manylinux2010_{platform}",
+                f"manylinux1_{platform}",
+                f"manylinux_2_5_{platform}",
+                f"manylinux_2_12_{platform}",
+                f"manylinux_2_17_{platform}",
+                f"linux_{platform}",
+                "any",
+            ))
+        elif system == "darwin":
+            platform = "arm64" if platform == "aarch64" else platform
+            self.platform_patterns = (
+                re.compile("any"),
+                re.compile(r"macosx_\d*_\d*_universal"),
+                re.compile(rf"macosx_\d*_\d*_{platform}"),
+            )
+        else:
+            raise Exception(f"Unsupported Platform {system}")
+        self._platform_priorities = {}
+        self._wheel_priorities = {}
+
+    def platform_priority(self, platform_tag: str) -> Optional[int]:
+        try:
+            return self._platform_priorities[platform_tag]
+        except KeyError:
+            pass
+        prio = next((i for i, p in enumerate(self.platform_patterns) if p.match(platform_tag)), None)
+        self._platform_priorities[platform_tag] = prio
+        return prio
+
+    def priority(self, fn: str) -> Optional[int]:
+        try:
+            return self._wheel_priorities[fn]
+        except KeyError:
+            pass
+        prio = None
+        tags = parse_wheel_fn(fn)
+        if tags is not None:
+            py_tags, abi_tags, platform_tags = tags
+            if not self.py_tags.isdisjoint(py_tags) and not self.abi_tags.isdisjoint(abi_tags):
+                prios = [p for p in map(self.platform_priority, platform_tags) if p is not None]
+                if prios:
+                    prio = min(prios)
+        self._wheel_priorities[fn] = prio
+        return prio
@@ -1,11 +1,12 @@
-from typing import Iterable, Dict
-
-from networkx import DiGraph, NetworkXNoCycle
-from tree_format import format_tree
+from typing import Iterable, Dict, TYPE_CHECKING
 
 from mach_nix.data.nixpkgs import NixpkgsIndex
 from mach_nix.resolver import ResolvedPkg
 
+# networkx and tree_format are slow to import and only needed once a resolution is done
+if TYPE_CHECKING:
+    from networkx import DiGraph
+
 
 def make_name(pkg: ResolvedPkg, nixpkgs: NixpkgsIndex):
     pi = pkg.provider_info
@@ -21,13 +22,13 @@ def make_name(pkg: ResolvedPkg, nixpkgs: NixpkgsIndex):
     return name
 
 
-def mark_removed_circular_dep(pkgs: Dict[str, ResolvedPkg], G: DiGraph, node, removed_node):
+def mark_removed_circular_dep(pkgs: Dict[str, ResolvedPkg], G: 'DiGraph', node, removed_node):
     pkgs[node].removed_circular_deps.add(removed_node)
     for pred in G.predecessors(node):
         mark_removed_circular_dep(pkgs, G, pred, removed_node)
 
 
-def remove_dependecy(pkgs: Dict[str, ResolvedPkg], G: DiGraph, node_from, node_to):
+def remove_dependecy(pkgs: Dict[str, ResolvedPkg], G: 'DiGraph', node_from, node_to):
     if pkgs[node_from].build_inputs is not None and node_to in pkgs[node_from].build_inputs:
         raise Exception(
             f"Fata error: cycle detected in setup requirements\n"
@@ -41,6 +42,7 @@ def remove_dependecy(pkgs: Dict[str, ResolvedPkg], G: DiGraph, node_from, node_t
 
 def remove_circles_and_print(pkgs: Iterable[ResolvedPkg], nixpkgs: NixpkgsIndex):
     import networkx as nx
+    from tree_format import format_tree
     print("\n### Resolved Dependencies ###\n")
     indexed_pkgs = {p.name: p for p in sorted(pkgs, key=lambda p: p.name)}
     roots: Iterable[ResolvedPkg] = sorted([p for p in pkgs if p.is_root], key=lambda p: p.name)
@@ -69,7 +71,7 @@ def remove_circles_and_print(pkgs: Iterable[ResolvedPkg], nixpkgs: NixpkgsIndex)
                 cycle_count += 1
                 remove_dependecy(indexed_pkgs, G, cycle[-1][0], cycle[-1][1])
                 removed_edges.append((cycle[-1][0], cycle[-1][1]))
-        except NetworkXNoCycle:
+        except nx.NetworkXNoCycle:
             continue
     for node, removed_node in removed_edges:
         mark_removed_circular_dep(indexed_pkgs, G, node, removed_node)
@@ -0,0 +1,58 @@
+import hashlib
+import os
+from os.path import dirname
+
+# Fingerprints identify the inputs cached data has been derived from (resolution cache, indices, packed DBs).
+# Paths in the nix store are immutable, for those the resolved path is sufficient.
+
+_code_fingerprint = None
+
+
+def code_fingerprint() -> str:
+    """
+    Hash over the python sources of mach-nix, so that cached results are invalidated on code changes
+    """
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        h = hashlib.sha256()
+        root = dirname(__file__)
+        for directory, dirs, files in sorted(os.walk(root)):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith('.py') or file == 'VERSION':
+                    h.update(file.encode())
+                    with open(f"{directory}/{file}", 'rb') as f:
+                        h.update(f.read())
+        _code_fingerprint = h.hexdigest()
+    return _code_fingerprint
+
+
+def file_fingerprint(path) -> str:
+    """
+    Hash over the content of a file
+    """
+    real = os.path.realpath(path)
+    if real.startswith('/nix/store/'):
+        return real
+    h = hashlib.sha256()
+    with open(real, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_fingerprint(path) -> str:
+    """
+    Hash over the names, sizes and modification times of all files below a directory.
+    Only the files are stat'ed, their content is never read, so this is cheap even for a whole pypi-deps-db.
+    """
+    real = os.path.realpath(path)
+    if real.startswith('/nix/store/'):
+        return real
+    h = hashlib.sha256()
+    for directory, dirs, names in sorted(os.walk(real)):
+        dirs.sort()
+        for name in sorted(names):
+            st = os.stat(f"{directory}/{name}")
+            h.update(f"{os.path.relpath(f'{directory}/{name}', real)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
@@ -3,76 +3,185 @@ import os
 import sys
 from os.path import dirname
 from pprint import pformat
-from typing import List
-
-import rich.traceback
-rich.traceback.install(show_locals=True)
+from typing import List, Optional, Set
 
 from resolvelib import ResolutionImpossible
 from resolvelib.resolvers import RequirementInformation
 
 import mach_nix
+from mach_nix.cache import print_cache_stats
 from mach_nix.data.nixpkgs import NixpkgsIndex
-from mach_nix.data.providers import CombinedDependencyProvider, ProviderSettings
+from mach_nix.data.providers import CombinedDependencyProvider, ProviderSettings, CondaDependencyProvider
 from mach_nix.exceptions import MachNixError
 from mach_nix.generators.overides_generator import OverridesGenerator
+from mach_nix.inputs import GenerateInputs, load_env, load_inputs
 from mach_nix.requirements import parse_reqs, filter_reqs_by_eval_marker, context
+from mach_nix.fingerprint import file_fingerprint, dir_fingerprint
+from mach_nix.resolution_cache import ResolutionCache
+from mach_nix.resolver.preferences import DEFAULT_PREFERENCE
+from mach_nix.resolver.profiling import ProfilingReporter
 from mach_nix.resolver.resolvelib_resolver import ResolvelibResolver
 from mach_nix.versions import PyVer
 
 
-def load_env(name, *args, **kwargs):
-    var = os.environ.get(name, *args, **kwargs)
-    if var is None:
-        print(f'Error: env variable "{name}" must not be empty', file=sys.stderr)
-        exit(1)
-    return var.strip()
-
-
-def do():
-    providers_json = load_env('providers')
-
-    conda_channels_json = load_env('conda_channels_json')
-    disable_checks = load_env('disable_checks')
-    nixpkgs_json = load_env('nixpkgs_json')
-    out_file = load_env('out_file')
-    provider_settings = ProviderSettings(providers_json)
-    py_ver_str = load_env('py_ver_str')
-    pypi_deps_db_src = load_env('pypi_deps_db_src')
-    pypi_fetcher_commit = load_env('pypi_fetcher_commit')
-    pypi_fetcher_sha256 = load_env('pypi_fetcher_sha256')
-    requirements = load_env('requirements')
+def prefetch_names(reqs, names_file=None) -> Set[str]:
+    """
+    Names of packages which are likely needed during resolution.
+    Besides the top level requirements, a file listing package names (one per line)
+    can be passed, for example the packages of a previous resolution.
+    """
+    names = {req.key for req in reqs}
+    if names_file and os.path.isfile(names_file):
+        with open(names_file) as f:
+            names.update(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return names
+
+
+def conda_repodata_fingerprints(conda_channels_json) -> dict:
+    """
+    Fingerprints of the repodata files of all conda channels, by channel name
+    """
+    with open(conda_channels_json) as f:
+        channels = json.load(f)
+    return {channel: [file_fingerprint(file) for file in files] for channel, files in channels.items()}
+
+
+def resolution_cache_inputs(inputs: GenerateInputs, py_ver_str, system) -> dict:
+    return dict(
+        requirements=inputs.requirements,
+        py_ver_str=py_ver_str,
+        system=system,
+        providers=file_fingerprint(inputs.providers_json),
+        conda_channels=file_fingerprint(inputs.conda_channels_json),
+        conda_repodata=conda_repodata_fingerprints(inputs.conda_channels_json),
+        conda_virtual_packages=CondaDependencyProvider.virtual_packages,
+        nixpkgs_json=file_fingerprint(inputs.nixpkgs_json),
+        pypi_deps_db_src=[dir_fingerprint(f"{inputs.pypi_deps_db_src}/{name}") for name in ('sdist', 'wheel')],
+        pypi_fetcher_commit=inputs.pypi_fetcher_commit,
+        pypi_fetcher_sha256=inputs.pypi_fetcher_sha256,
+        disable_checks=inputs.disable_checks,
+        preference=inputs.preference or DEFAULT_PREFERENCE,
+    )
 
-    platform, system = load_env('system').split('-')
 
-    py_ver = PyVer(py_ver_str)
-    nixpkgs = NixpkgsIndex(nixpkgs_json)
-    deps_provider = CombinedDependencyProvider(
-        conda_channels_json=conda_channels_json,
+def create_provider(inputs: GenerateInputs, py_ver: PyVer, system, nixpkgs: NixpkgsIndex):
+    platform, system_name = system.split('-')
+    return CombinedDependencyProvider(
+        conda_channels_json=inputs.conda_channels_json,
         nixpkgs=nixpkgs,
-        provider_settings=provider_settings,
-        pypi_deps_db_src=pypi_deps_db_src,
+        provider_settings=ProviderSettings(inputs.providers_json),
+        pypi_deps_db_src=inputs.pypi_deps_db_src,
         py_ver=py_ver,
         platform=platform,
-        system=system
+        system=system_name
     )
+
+
+def resolve_expr(
+        inputs: GenerateInputs,
+        py_ver_str,
+        system,
+        profile_file=None,
+        nixpkgs: NixpkgsIndex = None,
+        deps_provider: CombinedDependencyProvider = None) -> Optional[str]:
+    """
+    Resolves the requirements for one python version and system and returns the nix expression.
+    Data which doesn't depend on the requirements, like `nixpkgs` or a provider for the same target,
+    can be passed in to reuse it.
+    Returns None if the requirements could not be resolved.
+    """
+    platform, system_name = system.split('-')
+
+    res_cache = ResolutionCache.default()
+    if res_cache is not None:
+        cache_inputs = resolution_cache_inputs(inputs, py_ver_str, system)
+        cache_key = res_cache.key(cache_inputs)
+        expr = res_cache.get(cache_key)
+        if expr is not None:
+            print(f"Using cached resolution {cache_key[:16]} from {res_cache.directory}")
+            return expr
+
+    profiler = ProfilingReporter() if profile_file and os.environ.get('MACHNIX_RESOLVER_PROFILE') else None
+    py_ver = PyVer(py_ver_str)
+    if nixpkgs is None:
+        nixpkgs = NixpkgsIndex(inputs.nixpkgs_json)
+    if deps_provider is None:
+        deps_provider = create_provider(inputs, py_ver, system, nixpkgs)
     generator = OverridesGenerator(
         py_ver,
         nixpkgs,
-        pypi_fetcher_commit,
-        pypi_fetcher_sha256,
-        disable_checks,
-        ResolvelibResolver(nixpkgs, deps_provider),
+        inputs.pypi_fetcher_commit,
+        inputs.pypi_fetcher_sha256,
+        inputs.disable_checks,
+        ResolvelibResolver(nixpkgs, deps_provider, inputs.preference or DEFAULT_PREFERENCE, profiler),
     )
-    reqs = filter_reqs_by_eval_marker(parse_reqs(requirements), context(py_ver, platform, system))
+    reqs = list(filter_reqs_by_eval_marker(parse_reqs(inputs.requirements), context(py_ver, platform, system_name)))
+    deps_provider.prefetch(prefetch_names(reqs, os.environ.get('MACHNIX_PREFETCH_NAMES')))
     try:
         expr = generator.generate(reqs)
     except ResolutionImpossible as e:
-        handle_resolution_impossible(e, requirements, providers_json, py_ver_str)
-        exit(1)
+        handle_resolution_impossible(e, inputs.requirements, inputs.providers_json, py_ver_str)
+        return None
     else:
-        with open(out_file, 'w') as f:
-            f.write(expr)
+        if res_cache is not None:
+            try:
+                res_cache.put(cache_key, cache_inputs, expr)
+            except OSError as e:
+                print(f"WARNING: could not write resolution to cache: {e}", file=sys.stderr)
+        return expr
+    finally:
+        if profiler is not None:
+            profiler.dump(profile_file)
+            print(f"Wrote resolver profile to {profile_file}")
+
+
+def resolve_target(inputs: GenerateInputs, py_ver_str, system, out_file, nixpkgs: NixpkgsIndex = None) -> bool:
+    """
+    Like resolve_expr, but writes the expression to `out_file`.
+    Returns False if the requirements could not be resolved.
+    """
+    profile_file = f"{os.path.splitext(out_file)[0]}.profile.json"
+    expr = resolve_expr(inputs, py_ver_str, system, profile_file, nixpkgs)
+    if expr is None:
+        return False
+    with open(out_file, 'w') as f:
+        f.write(expr)
+    return True
+
+
+def resolve_via_daemon(socket_path, inputs: GenerateInputs) -> Optional[bool]:
+    """
+    Delegates the resolution to a running daemon (see mach_nix.daemon).
+    Returns None if the daemon isn't reachable.
+    """
+    from mach_nix.daemon import request_resolution, print_response
+    response = request_resolution(socket_path, inputs, load_env('py_ver_str'), load_env('system'))
+    if response is None:
+        print(f"WARNING: resolver daemon not reachable via {socket_path}, resolving locally", file=sys.stderr)
+        return None
+    print_response(response)
+    if response['ok']:
+        with open(load_env('out_file'), 'w') as f:
+            f.write(response['expr'])
+    return response['ok']
+
+
+def do():
+    inputs = load_inputs()
+    socket_path = os.environ.get('MACHNIX_DAEMON_SOCKET')
+    if socket_path:
+        ok = resolve_via_daemon(socket_path, inputs)
+        if ok is not None:
+            if not ok:
+                exit(1)
+            return
+    try:
+        ok = resolve_target(inputs, load_env('py_ver_str'), load_env('system'), load_env('out_file'))
+    finally:
+        if os.environ.get('MACHNIX_CACHE_STATS'):
+            print_cache_stats()
+    if not ok:
+        exit(1)
 
 
 def handle_resolution_impossible(exc: ResolutionImpossible, reqs_str, providers_json, py_ver_str):
@@ -101,7 +210,17 @@ def handle_resolution_impossible(exc: ResolutionImpossible, reqs_str, providers_
     )
 
 
+def print_exception(*exc_info):
+    """
+    Prints uncaught exceptions using rich, which is only imported if an error actually occurs
+    """
+    from rich.console import Console
+    from rich.traceback import Traceback
+    Console(stderr=True).print(Traceback.from_exception(*exc_info, show_locals=True))
+
+
 def main():
+    sys.excepthook = print_exception
     try:
         do()
     except MachNixError as e:
@@ -0,0 +1,106 @@
+"""
+Resolves the same requirements for multiple targets (python version + system) in one process.
+
+Takes the same env variables as generate.py, except for `py_ver_str`, `system` and `out_file`:
+  targets:          json list of objects with the keys `py_ver_str`, `system` and optionally `out_file`
+  out_dir:          directory for the expressions of targets without `out_file`
+  MACHNIX_WORKERS:  number of worker processes to resolve targets in parallel (default: 1)
+
+The nixpkgs index, the dependency DB and the conda channel indexes are loaded once and shared by all
+targets. Worker processes are forked after loading, so they share the loaded data as well.
+"""
+import json
+import multiprocessing
+import os
+import sys
+from dataclasses import dataclass
+from typing import List, Optional
+
+from mach_nix.cache import print_cache_stats
+from mach_nix.data.conda_index import open_channel_index
+from mach_nix.data.nixpkgs import NixpkgsIndex
+from mach_nix.data.packed_db import open_db
+from mach_nix.exceptions import MachNixError
+from mach_nix.generate import resolve_target, print_exception
+from mach_nix.inputs import GenerateInputs, load_env, load_inputs
+
+
+@dataclass
+class Target:
+    py_ver_str: str
+    system: str
+    out_file: str
+
+
+def load_targets(targets_json: str, out_dir: Optional[str]) -> List[Target]:
+    targets = []
+    for t in json.loads(targets_json):
+        out_file = t.get('out_file')
+        if out_file is None:
+            if not out_dir:
+                print("Error: env variable 'out_dir' must be set for targets without 'out_file'", file=sys.stderr)
+                exit(1)
+            out_file = f"{out_dir}/{t['system']}-python{t['py_ver_str']}.nix"
+        targets.append(Target(t['py_ver_str'], t['system'], out_file))
+    return targets
+
+
+def load_shared_data(inputs: GenerateInputs) -> NixpkgsIndex:
+    """
+    Loads everything which doesn't depend on the target. Providers created later on reuse it.
+    """
+    open_db(f"{inputs.pypi_deps_db_src}/wheel")
+    open_db(f"{inputs.pypi_deps_db_src}/sdist")
+    with open(inputs.conda_channels_json) as f:
+        for channel, files in json.load(f).items():
+            open_channel_index(channel, files)
+    return NixpkgsIndex(inputs.nixpkgs_json)
+
+
+# set before forking workers, which inherit it
+_shared = {}
+
+
+def _resolve(target: Target) -> bool:
+    print(f"Resolving for python {target.py_ver_str} on {target.system}")
+    try:
+        return resolve_target(
+            _shared['inputs'], target.py_ver_str, target.system, target.out_file, _shared['nixpkgs'])
+    except MachNixError as e:
+        print(e)
+        return False
+    except KeyboardInterrupt:
+        raise
+    # the resolver exits on some errors, which must only fail this target.
+    # In a worker, an uncaught SystemExit would never return a result and block pool.map forever.
+    except SystemExit:
+        return False
+    except BaseException:
+        print_exception(*sys.exc_info())
+        return False
+
+
+def main():
+    sys.excepthook = print_exception
+    inputs = load_inputs()
+    targets = load_targets(load_env('targets'), os.environ.get('out_dir'))
+    workers = min(int(os.environ.get('MACHNIX_WORKERS', 1)), len(targets))
+    _shared.update(inputs=inputs, nixpkgs=load_shared_data(inputs))
+    try:
+        if workers > 1:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(_resolve, targets, chunksize=1)
+        else:
+            results = list(map(_resolve, targets))
+    finally:
+        if os.environ.get('MACHNIX_CACHE_STATS'):
+            print_cache_stats()
+    failed = [t for t, ok in zip(targets, results) if not ok]
+    for t in failed:
+        print(f"Error: resolution failed for python {t.py_ver_str} on {t.system}", file=sys.stderr)
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
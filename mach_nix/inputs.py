@@ -0,0 +1,44 @@
+import os
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+# Kept free of heavy imports, since the resolver daemon's client needs it as well.
+
+
+def load_env(name, *args, **kwargs):
+    var = os.environ.get(name, *args, **kwargs)
+    if var is None:
+        print(f'Error: env variable "{name}" must not be empty', file=sys.stderr)
+        exit(1)
+    return var.strip()
+
+
+@dataclass
+class GenerateInputs:
+    """
+    Inputs shared by all targets (python version + system) of a resolution
+    """
+    providers_json: str
+    conda_channels_json: str
+    disable_checks: str
+    nixpkgs_json: str
+    pypi_deps_db_src: str
+    pypi_fetcher_commit: str
+    pypi_fetcher_sha256: str
+    requirements: str
+    preference: Optional[str] = None  # resolver preference strategy, None for the default one
+
+
+def load_inputs() -> GenerateInputs:
+    return GenerateInputs(
+        providers_json=load_env('providers'),
+        conda_channels_json=load_env('conda_channels_json'),
+        disable_checks=load_env('disable_checks'),
+        nixpkgs_json=load_env('nixpkgs_json'),
+        pypi_deps_db_src=load_env('pypi_deps_db_src'),
+        pypi_fetcher_commit=load_env('pypi_fetcher_commit'),
+        pypi_fetcher_sha256=load_env('pypi_fetcher_sha256'),
+        requirements=load_env('requirements'),
+        preference=os.environ.get('MACHNIX_RESOLVER_PREFERENCE'),
+    )
@@ -2,34 +2,57 @@ import re
 from typing import Iterable, Tuple, List
 
 import distlib.markers
-import pkg_resources
 from distlib.markers import DEFAULT_CONTEXT
+from distlib.util import parse_marker
 from packaging.specifiers import SpecifierSet
 
 from mach_nix.cache import cached
+from mach_nix.specifiers import RequirementMatcher
 from mach_nix.versions import PyVer, Version
 
 
-def context(py_ver: PyVer, platform: str, system: str):
-    context = DEFAULT_CONTEXT.copy()
-    context.update(dict(
+class MarkerContext(dict):
+    """
+    Environment for evaluating markers. Contexts with equal items share an `id`,
+    which marker results are memoized by. Must not be modified after creation.
+    """
+    _ids = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(DEFAULT_CONTEXT)
+        self.update(*args, **kwargs)
+        self.id = self._ids.setdefault(tuple(sorted(self.items())), len(self._ids))
+
+    def copy(self):
+        return MarkerContext(self)
+
+
+def context(py_ver: PyVer, platform: str, system: str) -> MarkerContext:
+    return MarkerContext(
         platform_version='',  # remove impure platform_version
         platform_release='',  # remove impure kernel verison
         platform_system=system[0].upper() + system[1:],  # eg. Linux or Darwin
         platform_machine=platform,  # eg. x86_64
         python_version=py_ver.python_version(),
         python_full_version=py_ver.python_full_version()
-    ))
-    return context
+    )
 
 
 class Requirement:
-    def __init__(self, name, extras, specs: Tuple[Tuple[Tuple[str, str]]], build=None, marker=None):
+    """
+    Requirements are interned by their line (see parse_req) and shared, so they must not be modified.
+    """
+    __slots__ = ('name', 'extras', 'specs', 'build', 'marker', 'marker_ast', '_matcher')
+
+    def __init__(self, name, extras, specs: Tuple[Tuple[Tuple[str, str]]], build=None, marker=None, marker_ast=None):
         self.name = name.lower().replace('_', '-')
         self.extras = extras or tuple()
         self.specs = specs or tuple()
         self.build = build
         self.marker = marker
+        # the marker as parsed by distlib, if known upfront
+        self.marker_ast = marker_ast
+        self._matcher = None
 
     def __repr__(self):
         return ' '.join(map(lambda x: str(x), filter(lambda e: e, (self.name, self.extras, self.specs, self.build, self.marker))))
@@ -38,23 +61,61 @@ class Requirement:
     def key(self):
         return self.name
 
+    @property
+    def matcher(self) -> RequirementMatcher:
+        if self._matcher is None:
+            self._matcher = RequirementMatcher(self.specs)
+        return self._matcher
+
     def __hash__(self):
         return hash((self.name, self.specs, self.build))
 
 
+@cached(maxsize=20_000)
+def compile_marker(marker: str):
+    """
+    Parses a marker into the expression tree evaluated by distlib
+    """
+    try:
+        expr, rest = parse_marker(marker)
+    except Exception as e:
+        raise SyntaxError(f"Unable to interpret marker syntax: {marker}: {e}")
+    if rest and rest[0] != '#':
+        raise SyntaxError(f"unexpected trailing data in marker: {marker}: {rest}")
+    return expr
+
+
+def eval_marker(marker: str, context: MarkerContext, extra=None, marker_ast=None) -> bool:
+    """
+    Evaluates a marker, optionally with `extra` set in the context.
+    Results are memoized per marker, context and extra. `marker_ast` can be passed if already known.
+    """
+    # pass all arguments positionally, so the cache key doesn't depend on how eval_marker was called
+    return _eval_marker(marker, context, extra, marker_ast)
+
+
+@cached(lambda args: (args[0], args[1].id, args[2]), maxsize=100_000)
+def _eval_marker(marker: str, context: MarkerContext, extra, marker_ast) -> bool:
+    if marker_ast is None:
+        marker_ast = compile_marker(marker)
+    if extra is not None:
+        context = {**context, 'extra': extra}
+    return bool(distlib.markers.evaluator.evaluate(marker_ast, context))
+
+
 def filter_reqs_by_eval_marker(reqs: Iterable[Requirement], context: dict, selected_extras=None):
     # filter requirements relevant for current environment
+    if not isinstance(context, MarkerContext):
+        context = MarkerContext(context)
     for req in reqs:
         if req.marker is None:
             yield req
         elif selected_extras:
             for extra in selected_extras:
-                extra_context = context.copy()
-                extra_context['extra'] = extra
-                if distlib.markers.interpret(str(req.marker), extra_context):
+                if eval_marker(req.marker, context, extra, req.marker_ast):
                     yield req
         else:
-            if distlib.markers.interpret(str(req.marker), context):
+            if eval_marker(req.marker, context, None, req.marker_ast):
                 yield req
 
 
@@ -62,9 +123,24 @@ all_ops = {'==', '!=', '<=', '>=', '<', '>', '~=', ';'}
 
 re_pytz = re.compile(r"pytz>dev|pytz\(>dev\)")
 
-@cached(lambda args: tuple(args[0]) if isinstance(args[0], list) else args[0])
+def yield_lines(strs):
+    """
+    Yields the non-empty, non-comment lines of a string or of a (nested) iterable of strings.
+    Same as pkg_resources.yield_lines, without the cost of importing pkg_resources.
+    """
+    if isinstance(strs, str):
+        for line in strs.splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    else:
+        for s in strs:
+            yield from yield_lines(s)
+
+
+@cached(lambda args: tuple(args[0]) if isinstance(args[0], list) else args[0], maxsize=50_000)
 def parse_reqs(strs):
-    lines = iter(pkg_resources.yield_lines(strs))
+    lines = iter(yield_lines(strs))
     for line in lines:
         if ' #' in line:
             line = line[:line.find(' #')]
@@ -74,7 +150,36 @@ def parse_reqs(strs):
                 line += next(lines)
             except StopIteration:
                 return
-        yield Requirement(*parse_reqs_line(line))
+        yield parse_req(line)
+
+
+@cached(lambda args: tuple(args[0]) if isinstance(args[0], list) else args[0], maxsize=50_000)
+def parse_reqs_preparsed(lines: List[str], parsed: List[list]):
+    """
+    Like parse_reqs, but takes the pre-parsed entries stored in the dependency DB next to the raw lines.
+    Each entry is [name, extras, specs, marker, marker_ast] or None for lines which need to be parsed here.
+    """
+    if parsed is None or len(parsed) != len(lines):
+        yield from parse_reqs(lines)
+        return
+    for line, entry in zip(lines, parsed):
+        if entry is None:
+            yield from parse_reqs(line)
+        else:
+            yield parse_req(line, entry)
+
+
+@cached(lambda args: args[0], maxsize=100_000)
+def parse_req(line: str, entry: list = None) -> Requirement:
+    """
+    Returns the Requirement of a single line, built from its pre-parsed `entry` if given.
+    Equal lines share the same Requirement object for the whole run.
+    """
+    if entry is None:
+        return Requirement(*parse_reqs_line(line))
+    name, extras, specs, marker, marker_ast = entry
+    specs = tuple(parse_specifiers(s) for s in specs)
+    return Requirement(name, tuple(extras), specs, None, marker, marker_ast)
 
 
 extra_name = r"([a-z]|[A-Z]|-|_|\.|\d)+"
@@ -110,6 +215,25 @@ re_reqs = re.compile(
     r"( *[:;] *(?P<marker>.*))?$")  # marker
 
 
+# Fast path for the plain PEP 508 subset, which makes up most lines of the dependency DB:
+#   name[extras] (op version, op version) ; marker
+# Lines with conda builds, specs without operator, alternatives (`|`) or anything unusual
+# fall back to `re_reqs`. Both must return the same result for lines matched by `re_reqs_fast`.
+re_fast_spec = r" *(?:==|!=|>=|<=|~=|<|>) *\d[A-Za-z0-9_.*+!-]*"
+re_reqs_fast = re.compile(
+    r"(?P<name>[A-Za-z0-9_.-]+)"
+    r"(?:\[(?P<extras>[A-Za-z0-9_.-]+(?:,[A-Za-z0-9_.-]+)*)\])?"
+    rf"(?: *\(?(?P<specs>{re_fast_spec}(?:,{re_fast_spec})*)\)?)?"
+    r"(?: *; *(?P<marker>.*))?")
+re_op = re.compile(r"==|!=|>=|<=|>|<|~=|=")
+re_single_eq = re.compile(r"=\d(\d|\.|\*|[a-z])*")
+
+
+@cached(maxsize=50_000)
+def parse_specifiers(specs: str) -> SpecifierSet:
+    return SpecifierSet(specs)
+
+
 def parse_reqs_line(line):
     # We special case `pytz>dev` since several packages have that requirement.
     # The intent is to accept any version, but the versioning scheme used by versions prior to 2013.6
@@ -117,7 +241,11 @@ def parse_reqs_line(line):
     # See https://github.com/pypa/pip/issues/974#issuecomment-22641489
     if line == 'pytz>dev' or line == 'pytz (>dev)':
         return ("pytz", (), (), None, None)
+    line = normalize_line(line)
+    return parse_line_fast(line) or parse_line_regex(line)
 
+
+def normalize_line(line):
     line = line.split("#")[0].strip()
     if line.endswith("==*"):
         line = line[:-3]
@@ -137,7 +265,26 @@ def parse_reqs_line(line):
     
     if line.endswith(','):
         line = line[:-1]
+    return line
+
+
+def parse_line_fast(line):
+    """
+    Parses a normalized line if it is of the plain PEP 508 form, otherwise returns None
+    """
+    match = re_reqs_fast.fullmatch(line)
+    if not match:
+        return None
+    name, extras, specs, marker = match.group('name', 'extras', 'specs', 'marker')
+    extras = tuple(extras.split(',')) if extras else tuple()
+    if specs:
+        specs = (parse_specifiers(specs),)
+    if marker:
+        extras = extras + extras_from_marker(marker)
+    return name, extras, specs, None, marker
+
 
+def parse_line_regex(line):
     match = re.fullmatch(re_reqs, line)
     if not match:
         raise Exception(f"couldn't parse: '{line}'")
@@ -173,12 +320,12 @@ def parse_reqs_line(line):
             parts = specs.split(',')
             parsed_parts = []
             for part in parts:
-                if not re.search(r"==|!=|>=|<=|>|<|~=|=", part):
+                if not re_op.search(part):
                     part = '==' + part
-                elif re.fullmatch(r"=\d(\d|\.|\*|[a-z])*", part):
+                elif re_single_eq.fullmatch(part):
                     part = '=' + part
                 parsed_parts.append(part)
-            all_specs.append(SpecifierSet(",".join(parsed_parts)))
+            all_specs.append(parse_specifiers(",".join(parsed_parts)))
 
         all_specs = tuple(all_specs)
 
@@ -189,7 +336,6 @@ def parse_reqs_line(line):
 
     return name, extras, all_specs, build, marker
 
-@cached(keyfunc=lambda args: hash((tuple(args[0]), args[1])))
 def filter_versions(
         versions: List[Version],
         req: Requirement) -> List[Version]:
@@ -198,13 +344,4 @@ def filter_versions(
     which are allowed according to the given specifiers
     """
     assert isinstance(versions, list)
-    if not req.specs:
-        # We filter version with an empty specifier set, since that will filter
-        # out prerelease, if there are any other releases.
-        return list(SpecifierSet().filter(versions)) # return a list in both cases
-    matched_versions = []
-    for specs in req.specs:
-        matched_versions.extend(
-            specs.filter(versions)
-        )
-    return matched_versions
+    return req.matcher.filter(versions)
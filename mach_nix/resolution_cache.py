@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Optional
+
+from mach_nix.cache import persistent_cache_dir
+from mach_nix.fingerprint import code_fingerprint
+
+DEFAULT_MAX_SIZE_MB = 100
+STATS_FILE = "stats.json"
+
+
+class ResolutionCache:
+    """
+    Content addressed on-disk cache for generated expressions.
+    Entries are keyed by a hash over all inputs of the resolution and evicted
+    in least recently used order once the cache exceeds `max_size` bytes.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def default(cls) -> Optional['ResolutionCache']:
+        directory = persistent_cache_dir('resolutions')
+        if directory is None:
+            return None
+        max_size_mb = float(os.environ.get('MACHNIX_RESOLUTION_CACHE_SIZE_MB', DEFAULT_MAX_SIZE_MB))
+        return cls(directory, int(max_size_mb * 1024 * 1024))
+
+    @staticmethod
+    def key(inputs: dict) -> str:
+        inputs = dict(inputs, mach_nix=code_fingerprint())
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def _file(self, key):
+        return f"{self.directory}/{key}.json"
+
+    def _write_json(self, file, data):
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, file)
+
+    def _count(self, stat):
+        stats = self.load_stats()
+        stats[stat] = stats.get(stat, 0) + 1
+        try:
+            self._write_json(f"{self.directory}/{STATS_FILE}", stats)
+        except OSError:
+            pass
+
+    def load_stats(self) -> dict:
+        try:
+            with open(f"{self.directory}/{STATS_FILE}") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key) -> Optional[str]:
+        file = self._file(key)
+        try:
+            with open(file) as f:
+                entry = json.load(f)
+            # mark as recently used
+            os.utime(file)
+        except (OSError, ValueError):
+            self._count('misses')
+            return None
+        self._count('hits')
+        return entry['expr']
+
+    def put(self, key, inputs: dict, expr: str):
+        self._write_json(self._file(key), dict(inputs=inputs, created=time.time(), expr=expr))
+        self.evict()
+
+    def entries(self):
+        """
+        returns (key, size, last_used) of all entries, least recently used first
+        """
+        result = []
+        for file in os.listdir(self.directory):
+            if not file.endswith('.json') or file == STATS_FILE:
+                continue
+            try:
+                st = os.stat(f"{self.directory}/{file}")
+            except OSError:
+                continue
+            result.append((file[:-len('.json')], st.st_size, st.st_mtime))
+        return sorted(result, key=lambda e: e[2])
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                continue
+            total -= size
+            self._count('evictions')
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            os.remove(self._file(key))
+        if os.path.isfile(f"{self.directory}/{STATS_FILE}"):
+            os.remove(f"{self.directory}/{STATS_FILE}")
+
+    def inspect(self, key) -> dict:
+        with open(self._file(key)) as f:
+            return json.load(f)
+
+
+def main():
+    parser = ArgumentParser(prog='python -m mach_nix.resolution_cache', description='inspect the resolution cache')
+    parser.add_argument('command', choices=('stats', 'list', 'show', 'clear'))
+    parser.add_argument('key', nargs='?', help='entry to show')
+    args = parser.parse_args()
+    cache = ResolutionCache.default()
+    if cache is None:
+        print("The resolution cache is disabled or its directory is not writable", file=sys.stderr)
+        exit(1)
+    if args.command == 'stats':
+        entries = cache.entries()
+        stats = cache.load_stats()
+        print(f"directory: {cache.directory}")
+        print(f"entries:   {len(entries)}")
+        print(f"size:      {sum(e[1] for e in entries) / 1024 / 1024:.2f} MB (max {cache.max_size / 1024 / 1024:.0f} MB)")
+        for stat in ('hits', 'misses', 'evictions'):
+            print(f"{stat + ':':<10} {stats.get(stat, 0)}")
+    elif args.command == 'list':
+        for key, size, last_used in reversed(cache.entries()):
+            inputs = cache.inspect(key)['inputs']
+            reqs = ', '.join(inputs['requirements'].splitlines())
+            print(f"{key[:16]}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))}  "
+                  f"{size / 1024:8.1f} KB  python {inputs['py_ver_str']}  {inputs['system']}  {reqs[:60]}")
+    elif args.command == 'show':
+        matches = [key for key, _, _ in cache.entries() if args.key and key.startswith(args.key)]
+        if len(matches) != 1:
+            print(f"Error: key '{args.key}' does not identify a single entry", file=sys.stderr)
+            exit(1)
+        print(json.dumps(cache.inspect(matches[0])['inputs'], indent=2))
+    elif args.command == 'clear':
+        cache.clear()
+
+
+if __name__ == "__main__":
+    main()
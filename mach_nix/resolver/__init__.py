@@ -1,27 +1,41 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
 from typing import List, Optional, Iterable, Set
 
 from mach_nix.data.providers import ProviderInfo
 from mach_nix.requirements import Requirement
 from mach_nix.versions import Version
 
-from json import JSONEncoder
-
-
-@dataclass
-class ResolvedPkg(JSONEncoder):
-    name: str
-    ver: Version
-    raw_version: str
-    build_inputs: Optional[List[str]]
-    prop_build_inputs: Optional[List[str]]
-    is_root: bool
-    provider_info: ProviderInfo
-    extras_selected: List[str]
-    # contains direct or indirect children which have been disconnected due to circular deps
-    removed_circular_deps: Set[str] = field(default_factory=set)
-    build: str = None
+
+class ResolvedPkg:
+    __slots__ = ('name', 'ver', 'raw_version', 'build_inputs', 'prop_build_inputs', 'is_root', 'provider_info',
+                 'extras_selected', 'removed_circular_deps', 'build')
+
+    def __init__(
+            self,
+            name: str,
+            ver: Version,
+            raw_version: str,
+            build_inputs: Optional[List[str]],
+            prop_build_inputs: Optional[List[str]],
+            is_root: bool,
+            provider_info: ProviderInfo,
+            extras_selected: List[str],
+            removed_circular_deps: Set[str] = None,
+            build: str = None):
+        self.name = name
+        self.ver = ver
+        self.raw_version = raw_version
+        self.build_inputs = build_inputs
+        self.prop_build_inputs = prop_build_inputs
+        self.is_root = is_root
+        self.provider_info = provider_info
+        self.extras_selected = extras_selected
+        # contains direct or indirect children which have been disconnected due to circular deps
+        self.removed_circular_deps = set() if removed_circular_deps is None else removed_circular_deps
+        self.build = build
+
+    def __repr__(self):
+        return f"ResolvedPkg({self.name}=={self.raw_version})"
 
     def toDict(self):
         return dict(
@@ -0,0 +1,97 @@
+import math
+from abc import ABC, abstractmethod
+from typing import Dict
+
+# Strategies for `get_preference` of the resolvelib provider.
+# resolvelib resolves the identifier with the lowest preference key next.
+# Instead of the candidates, strategies get `candidate_count`, which returns the number of candidates of an identifier
+# without loading them one by one.
+
+
+class PreferenceStrategy(ABC):
+    name = None
+
+    @abstractmethod
+    def key(self, identifier, resolutions, candidate_count, information, backtrack_causes):
+        pass
+
+
+class CandidateCountPreference(PreferenceStrategy):
+    """
+    Resolves packages with the fewest remaining candidates first.
+    """
+    name = 'candidates'
+
+    def key(self, identifier, resolutions, candidate_count, information, backtrack_causes):
+        return candidate_count(identifier)
+
+
+class PipPreference(PreferenceStrategy):
+    """
+    Modelled after pip's provider:
+    https://github.com/pypa/pip/blob/main/src/pip/_internal/resolution/resolvelib/provider.py
+    In order, packages are preferred if they are:
+      - pinned via `==` or `===`
+      - the cause of the last backtracking, or a parent of it
+      - closer to the root requirements
+      - restricted by any specifier
+      - providing fewer candidates
+    setuptools is delayed, because it is required by many packages but rarely restricted.
+    """
+    name = 'pip'
+
+    def __init__(self):
+        self._known_depths: Dict[str, float] = {}
+
+    @staticmethod
+    def _is_pinned(req):
+        for specset in req.specs:
+            for spec in specset:
+                if spec.operator == '===' or (spec.operator == '==' and not spec.version.endswith('.*')):
+                    return True
+        return False
+
+    @staticmethod
+    def _is_backtrack_cause(identifier, backtrack_causes):
+        for cause in backtrack_causes:
+            if identifier == cause.requirement.name:
+                return True
+            if cause.parent is not None and identifier == cause.parent.name:
+                return True
+        return False
+
+    def _depth(self, identifier, information):
+        parent_depths = (
+            self._known_depths.get(parent.name, math.inf) if parent is not None else 0.0
+            for _, parent in information[identifier]
+        )
+        depth = min(parent_depths, default=math.inf) + 1.0
+        self._known_depths[identifier] = depth
+        return depth
+
+    def key(self, identifier, resolutions, candidate_count, information, backtrack_causes):
+        reqs = [r for r, _ in information[identifier]]
+        pinned = any(self._is_pinned(r) for r in reqs)
+        restricted = any(r.specs for r in reqs)
+        return (
+            identifier == 'setuptools',
+            not pinned,
+            not self._is_backtrack_cause(identifier, backtrack_causes),
+            self._depth(identifier, information),
+            not restricted,
+            candidate_count(identifier),
+            identifier,
+        )
+
+
+strategies = {s.name: s for s in (CandidateCountPreference, PipPreference)}
+
+DEFAULT_PREFERENCE = CandidateCountPreference.name
+
+
+def get_preference_strategy(name: str) -> PreferenceStrategy:
+    try:
+        return strategies[name]()
+    except KeyError:
+        raise Exception(
+            f"Unknown resolver preference '{name}'. Available are: {', '.join(sorted(strategies))}")
@@ -0,0 +1,117 @@
+import json
+from collections import defaultdict
+from time import perf_counter
+
+import resolvelib
+
+
+class PackageStats:
+    __slots__ = ('requirements', 'pins', 'attempts', 'backtracks', 'conflicts',
+                 'find_matches_calls', 'find_matches_time', 'get_dependencies_time')
+
+    def __init__(self):
+        self.requirements = 0
+        self.pins = 0
+        self.attempts = 0
+        self.backtracks = 0
+        self.conflicts = 0
+        self.find_matches_calls = 0
+        self.find_matches_time = 0.0
+        self.get_dependencies_time = 0.0
+
+    @property
+    def rejections(self):
+        # resolvelib 0.8 has no hook for rejected candidates. Each attempt to pin a candidate
+        # calls get_dependencies once and either ends in a pin or in a rejection.
+        return self.attempts - self.pins
+
+    def toDict(self):
+        return dict(
+            requirements_added=self.requirements,
+            pins=self.pins,
+            rejections=self.rejections,
+            backtracks=self.backtracks,
+            conflicts=self.conflicts,
+            find_matches=dict(calls=self.find_matches_calls, seconds=round(self.find_matches_time, 6)),
+            get_dependencies=dict(calls=self.attempts, seconds=round(self.get_dependencies_time, 6)),
+        )
+
+
+class ProfilingReporter(resolvelib.BaseReporter):
+    """
+    Records rounds, pins, rejections and backtracks per package, plus the time the provider
+    spends in find_matches and get_dependencies. The timings are reported by the provider.
+    """
+
+    def __init__(self):
+        self.packages = defaultdict(PackageStats)
+        self.preference = None
+        self.rounds = 0
+        self.result = None
+        self._start = None
+        self.duration = None
+
+    def starting(self):
+        self._start = perf_counter()
+
+    def starting_round(self, index):
+        self.rounds = index + 1
+
+    def ending(self, state):
+        self.result = 'ok'
+
+    def adding_requirement(self, requirement, parent):
+        self.packages[requirement.name].requirements += 1
+
+    def resolving_conflicts(self, causes):
+        for name in {c.requirement.name for c in causes}:
+            self.packages[name].conflicts += 1
+
+    def backtracking(self, candidate):
+        self.packages[candidate.name].backtracks += 1
+
+    def pinning(self, candidate):
+        self.packages[candidate.name].pins += 1
+
+    def found_matches(self, identifier, seconds, calls=1):
+        # candidates are loaded lazily, the time of iterating them is reported separately with calls=0
+        stats = self.packages[identifier]
+        stats.find_matches_calls += calls
+        stats.find_matches_time += seconds
+
+    def got_dependencies(self, candidate, seconds):
+        stats = self.packages[candidate.name]
+        stats.attempts += 1
+        stats.get_dependencies_time += seconds
+
+    def finish(self, result=None):
+        if result is not None:
+            self.result = result
+        if self._start is not None:
+            self.duration = perf_counter() - self._start
+
+    def toDict(self):
+        packages = sorted(
+            self.packages.items(),
+            key=lambda item: (-(item[1].backtracks + item[1].rejections), item[0]))
+        return dict(
+            preference=self.preference,
+            result=self.result,
+            duration=round(self.duration, 6) if self.duration is not None else None,
+            rounds=self.rounds,
+            pins=sum(s.pins for s in self.packages.values()),
+            rejections=sum(s.rejections for s in self.packages.values()),
+            backtracks=sum(s.backtracks for s in self.packages.values()),
+            find_matches=dict(
+                calls=sum(s.find_matches_calls for s in self.packages.values()),
+                seconds=round(sum(s.find_matches_time for s in self.packages.values()), 6)),
+            get_dependencies=dict(
+                calls=sum(s.attempts for s in self.packages.values()),
+                seconds=round(sum(s.get_dependencies_time for s in self.packages.values()), 6)),
+            packages={name: stats.toDict() for name, stats in packages},
+        )
+
+    def dump(self, file):
+        with open(file, 'w') as f:
+            json.dump(self.toDict(), f, indent=2)
+
@@ -1,3 +1,4 @@
+from time import perf_counter
 from typing import Iterable, List
 
 import resolvelib
@@ -5,15 +6,24 @@ import resolvelib
 from mach_nix.data.nixpkgs import NixpkgsIndex
 from mach_nix.data.providers import DependencyProviderBase, Candidate
 from mach_nix.deptree import remove_circles_and_print
-from mach_nix.requirements import Requirement, filter_versions
+from mach_nix.requirements import Requirement
 from mach_nix.resolver import Resolver, ResolvedPkg
+from mach_nix.resolver.profiling import ProfilingReporter
+from mach_nix.resolver.preferences import PreferenceStrategy, get_preference_strategy, DEFAULT_PREFERENCE
 
 
 # Implement logic so the resolver understands the requirement format.
 class Provider(resolvelib.providers.AbstractProvider):
-    def __init__(self, nixpkgs: NixpkgsIndex, deps_db: DependencyProviderBase):
+    def __init__(
+            self,
+            nixpkgs: NixpkgsIndex,
+            deps_db: DependencyProviderBase,
+            preference: PreferenceStrategy,
+            profiler: ProfilingReporter = None):
         self.nixpkgs = nixpkgs
         self.provider = deps_db
+        self.preference = preference
+        self.profiler = profiler
 
     def get_extras_for(self, dependency):
         # return selected extras
@@ -28,23 +38,50 @@ class Provider(resolvelib.providers.AbstractProvider):
     def get_preference(
         self, identifier, resolutions, candidates, information, backtrack_causes
     ):
-        # This logic could be improved, for example to prefer the cause of backtracking.
-        # See https://github.com/pypa/pip/blob/main/src/pip/_internal/resolution/resolvelib/provider.py
-        # for the implementation in pip.
-        return sum(1 for _ in candidates[identifier])
+        return self.preference.key(
+            identifier, resolutions, lambda name: self.count_matches(name, information), information, backtrack_causes)
+
+    def count_matches(self, identifier, information) -> int:
+        """
+        Counts the candidates matching the current requirements of `identifier` without iterating them.
+        Candidates which have been rejected while backtracking are included in the count.
+        """
+        return self.provider.count_matches([r for r, _ in information[identifier]])
 
     def find_matches(self, identifier, requirements, incompatibilities):
-        return [
-            candidate
-            for candidate in self.provider.find_matches(list(requirements[identifier]))
-            if candidate not in incompatibilities.get(identifier, ())
-        ]
+        # resolvelib accepts a factory of iterators, so candidates are only loaded when inspected
+        reqs = list(requirements[identifier])
+        incompatible = set(incompatibilities.get(identifier, ()))
+
+        def matches():
+            return (c for c in self.provider.iter_matches(reqs) if c not in incompatible)
+
+        if self.profiler is not None:
+            self.profiler.found_matches(identifier, 0.0)
+            return lambda: self._timed_matches(identifier, matches())
+        return matches
+
+    def _timed_matches(self, identifier, candidates):
+        while True:
+            start = perf_counter()
+            candidate = next(candidates, None)
+            self.profiler.found_matches(identifier, perf_counter() - start, calls=0)
+            if candidate is None:
+                return
+            yield candidate
 
     def is_satisfied_by(self, requirement, candidate: Candidate):
-        res = bool(len(list(filter_versions([candidate.ver], requirement))))
-        return res
+        return requirement.matcher.contains(candidate.ver)
 
     def get_dependencies(self, candidate):
+        if self.profiler is not None:
+            start = perf_counter()
+            deps = self._get_dependencies(candidate)
+            self.profiler.got_dependencies(candidate, perf_counter() - start)
+            return deps
+        return self._get_dependencies(candidate)
+
+    def _get_dependencies(self, candidate):
         install_requires, setup_requires = self.provider.get_pkg_reqs(candidate)
         if install_requires is None:
             install_requires = []
@@ -55,13 +92,31 @@ class Provider(resolvelib.providers.AbstractProvider):
 
 
 class ResolvelibResolver(Resolver):
-    def __init__(self, nixpkgs: NixpkgsIndex, deps_provider: DependencyProviderBase):
+    def __init__(
+            self,
+            nixpkgs: NixpkgsIndex,
+            deps_provider: DependencyProviderBase,
+            preference: str = DEFAULT_PREFERENCE,
+            reporter: resolvelib.BaseReporter = None):
         self.nixpkgs = nixpkgs
         self.deps_provider = deps_provider
+        self.preference = preference
+        self.reporter = reporter
 
     def resolve(self, reqs: Iterable[Requirement]) -> List[ResolvedPkg]:
-        reporter = resolvelib.BaseReporter()
-        result = resolvelib.Resolver(Provider(self.nixpkgs, self.deps_provider), reporter).resolve(reqs, max_rounds=1000)
+        reporter = self.reporter or resolvelib.BaseReporter()
+        profiler = reporter if isinstance(reporter, ProfilingReporter) else None
+        if profiler is not None:
+            profiler.preference = self.preference
+        provider = Provider(self.nixpkgs, self.deps_provider, get_preference_strategy(self.preference), profiler)
+        try:
+            result = resolvelib.Resolver(provider, reporter).resolve(reqs, max_rounds=1000)
+        except Exception as e:
+            if profiler is not None:
+                profiler.finish(type(e).__name__)
+            raise
+        if profiler is not None:
+            profiler.finish()
         nix_py_pkgs = []
         for name in result.graph._forwards.keys():
             if name is None or name.startswith('-'):
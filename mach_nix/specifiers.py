@@ -0,0 +1,214 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Set
+
+from packaging.specifiers import SpecifierSet, Specifier
+
+from mach_nix.cache import cached
+from mach_nix.versions import Version, version_key, base_key
+
+# Compiled matching of version specifiers against sorted version arrays.
+#
+# For the comparison operators (<, <=, >, >=, ==, !=) packaging's special cases
+# (pre-, post- and local releases, zero padding) only concern versions with the same
+# epoch and release segment as the specifier version. Those versions are adjacent in
+# sort order. Everything below or above that block is decided by bisection on the
+# precomputed version keys, only the block itself is checked via `Specifier.contains`.
+# All other operators are checked via `Specifier.contains`, narrowed down to the range
+# of versions sharing the release prefix where possible.
+
+
+class SortedVersions:
+    """
+    Distinct versions sorted ascending, plus precomputed keys and flags used for bisection
+    """
+
+    def __init__(self, versions: Iterable[Version]):
+        self.versions = sorted(set(versions), key=version_key)
+        self.keys = [version_key(v) for v in self.versions]
+        self.base_keys = [k[:2] for k in self.keys]
+        self.index = {v: i for i, v in enumerate(self.versions)}
+        self.legacy = [not isinstance(v, Version) for v in self.versions]
+        self.pre = [not legacy and v.is_prerelease for v, legacy in zip(self.versions, self.legacy)]
+        # indices of versions which can match a PEP 440 specifier, with and without pre-releases
+        self.final_idx = [i for i in range(len(self.versions)) if not self.legacy[i] and not self.pre[i]]
+        self.pep440_idx = [i for i in range(len(self.versions)) if not self.legacy[i]]
+
+    def __len__(self):
+        return len(self.versions)
+
+
+def _release_prefix_bounds(version_str):
+    """
+    For a wildcard prefix like `1.2` returns the base keys (lower, upper) of all versions starting with it.
+    Returns None if the prefix isn't a plain release.
+    """
+    try:
+        prefix = Version(version_str)
+    except Exception:
+        return None
+    if any(part is not None for part in (prefix.pre, prefix.post, prefix.dev, prefix.local)):
+        return None
+    release = prefix.release
+    lower = base_key(prefix)
+    upper = base_key(Version(f"{prefix.epoch}!{'.'.join(map(str, release[:-1] + (release[-1] + 1,)))}"))
+    return lower, upper
+
+
+class CompiledSpecifier:
+    """
+    A single specifier. For a SortedVersions it computes the index range [lo, hi) of matching versions,
+    plus a block [blo, bhi) of versions which have to be checked via `Specifier.contains` instead.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.op = spec.operator
+        self.pep440 = isinstance(spec, Specifier)
+        self.key = None
+        self.bounds = None
+        if not self.pep440 or self.op == '===':
+            return
+        if self.op in ('<', '<=', '>', '>=', '==', '!=') and not spec.version.endswith('.*'):
+            ver = Version(spec.version)
+            self.key = version_key(ver)
+            self.base = base_key(ver)
+        elif self.op in ('==', '!='):
+            self.bounds = _release_prefix_bounds(spec.version[:-2])
+        elif self.op == '~=':
+            # ~=X.Y.Z is equivalent to >=X.Y.Z, ==X.Y.*
+            ver = Version(spec.version)
+            prefix = '.'.join(map(str, ver.release[:-1]))
+            if ver.epoch:
+                prefix = f"{ver.epoch}!{prefix}"
+            self.bounds = _release_prefix_bounds(prefix)
+
+    def ranges(self, sv: SortedVersions):
+        n = len(sv)
+        if self.key is not None:
+            blo = bisect_left(sv.base_keys, self.base)
+            bhi = bisect_right(sv.base_keys, self.base)
+            if self.op in ('<', '<='):
+                return 0, blo, blo, bhi
+            if self.op in ('>', '>='):
+                return bhi, n, blo, bhi
+            if self.op == '==':
+                return blo, blo, blo, bhi
+            # !=
+            return 0, n, blo, bhi
+        if self.bounds is not None:
+            blo = bisect_left(sv.base_keys, self.bounds[0])
+            bhi = bisect_left(sv.base_keys, self.bounds[1])
+            if self.op == '!=':
+                return 0, n, blo, bhi
+            return blo, blo, blo, bhi
+        return 0, 0, 0, n
+
+    def contains(self, ver, allow_pre) -> bool:
+        if self.key is not None:
+            if not isinstance(ver, Version) or (ver.is_prerelease and not allow_pre):
+                return False
+            base = base_key(ver)
+            if base != self.base:
+                if self.op in ('<', '<='):
+                    return base < self.base
+                if self.op in ('>', '>='):
+                    return base > self.base
+                return self.op == '!='
+        return self.spec.contains(ver, prereleases=allow_pre)
+
+
+class CompiledSpecifierSet:
+
+    def __init__(self, specset: SpecifierSet):
+        self.specs = [CompiledSpecifier(s) for s in specset]
+        self.allow_pre = bool(specset.prereleases)
+        self.pep440 = all(s.pep440 for s in self.specs)
+
+    def contains(self, ver) -> bool:
+        if not self.specs:
+            return isinstance(ver, Version)
+        return all(s.contains(ver, self.allow_pre) for s in self.specs)
+
+    def filter_indices(self, sv: SortedVersions, subset: Optional[Set[int]] = None) -> Set[int]:
+        """
+        Returns the indices of versions in `sv` matching this specifier set.
+        If `subset` is given, only those indices are considered.
+        Behaves like `SpecifierSet.filter`.
+        """
+        if not self.specs:
+            return self._filter_no_specs(sv, subset)
+        lo, hi, blocks = 0, len(sv), []
+        for s in self.specs:
+            r_lo, r_hi, b_lo, b_hi = s.ranges(sv)
+            if b_lo < b_hi:
+                blocks.append((b_lo, b_hi))
+                if r_lo >= r_hi:
+                    r_lo, r_hi = b_lo, b_hi
+                else:
+                    r_lo, r_hi = min(r_lo, b_lo), max(r_hi, b_hi)
+            lo, hi = max(lo, r_lo), min(hi, r_hi)
+        if lo >= hi:
+            return set()
+        versions = sv.versions
+        result = set()
+        in_block = set()
+        for b_lo, b_hi in blocks:
+            for i in range(max(lo, b_lo), min(hi, b_hi)):
+                if i in in_block or (subset is not None and i not in subset):
+                    continue
+                in_block.add(i)
+                if self.contains(versions[i]):
+                    result.add(i)
+        if self.pep440:
+            # outside of the blocks, all versions in range match, except for legacy and pre-releases
+            allowed = sv.pep440_idx if self.allow_pre else sv.final_idx
+            for i in allowed[bisect_left(allowed, lo):bisect_left(allowed, hi)]:
+                if i not in in_block and (subset is None or i in subset):
+                    result.add(i)
+        return result
+
+    @staticmethod
+    def _filter_no_specs(sv: SortedVersions, subset: Optional[Set[int]]) -> Set[int]:
+        # releases only, unless there are no releases but pre-releases
+        candidates = sv.pep440_idx if subset is None else [i for i in sv.pep440_idx if i in subset]
+        finals = {i for i in candidates if not sv.pre[i]}
+        return finals if finals else set(candidates)
+
+
+# SpecifierSet equality ignores trailing zeros (~=1.0 == ~=1.0.0), therefore the string is used as key
+@cached(lambda args: str(args[0]), maxsize=50_000)
+def compile_specifier_set(specset: SpecifierSet) -> CompiledSpecifierSet:
+    return CompiledSpecifierSet(specset)
+
+
+class RequirementMatcher:
+    """
+    Compiled specifiers of a requirement. Multiple specifier sets (conda style `|`) are OR-ed.
+    """
+
+    def __init__(self, specs):
+        if specs:
+            self.specsets = [compile_specifier_set(s) for s in specs]
+        else:
+            self.specsets = [compile_specifier_set(SpecifierSet())]
+
+    def contains(self, ver) -> bool:
+        return any(s.contains(ver) for s in self.specsets)
+
+    def filter_indices(self, sv: SortedVersions, subset: Optional[Set[int]] = None) -> Set[int]:
+        if len(self.specsets) == 1:
+            return self.specsets[0].filter_indices(sv, subset)
+        result = set()
+        for s in self.specsets:
+            result |= s.filter_indices(sv, subset)
+        return result
+
+    def filter(self, versions: List[Version]) -> List[Version]:
+        """
+        Filters an arbitrary list of versions, keeping the order
+        """
+        if len(versions) == 1:
+            return versions if self.contains(versions[0]) else []
+        sv = SortedVersions(versions)
+        matching = {sv.versions[i] for i in self.filter_indices(sv)}
+        return [v for v in versions if v in matching]
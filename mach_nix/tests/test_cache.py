@@ -0,0 +1,37 @@
+from mach_nix.cache import cached, cache_info, clear_caches
+
+
+def test_cached_counts_hits_and_misses():
+    calls = []
+
+    @cached()
+    def double(x):
+        calls.append(x)
+        return x * 2
+
+    assert [double(1), double(1), double(2)] == [2, 2, 4]
+    assert calls == [1, 2]
+    info = double.cache.info()
+    assert (info.hits, info.misses, info.size) == (1, 2, 2)
+    assert info in cache_info()
+    clear_caches()
+    assert double.cache.info().size == 0
+    double(1)
+    assert calls == [1, 2, 1]
+
+
+def test_cached_lru_limit():
+    @cached(maxsize=2)
+    def ident(x):
+        return x
+
+    ident(1), ident(2), ident(1), ident(3)
+    assert list(k[0][0] for k in ident.cache.data) == [1, 3]
+
+
+def test_caches_keyed_by_input_lines_are_bounded():
+    from mach_nix.requirements import parse_req, parse_reqs, _eval_marker, compile_marker
+    from mach_nix.specifiers import compile_specifier_set
+    # these grow with every distinct line or marker, which matters for long lived processes like the daemon
+    for func in (parse_req, parse_reqs, _eval_marker, compile_marker, compile_specifier_set):
+        assert func.cache.maxsize
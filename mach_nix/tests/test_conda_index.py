@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from mach_nix.data import conda_index
+from mach_nix.data.conda_index import CondaChannelIndex, iter_repodata_packages
+from mach_nix.versions import parse_ver
+
+
+def record(name, version, build, subdir='linux-64', depends=(), **kwargs):
+    return dict(name=name, version=version, build=build, build_number=0, depends=list(depends), subdir=subdir, **kwargs)
+
+
+repodata_linux = {
+    "info": {"subdir": "linux-64", "nested": {"list": [1, 2.5, True, None]}},
+    "packages": {
+        "numpy-1.19.0-py38_0.tar.bz2": record(
+            "numpy", "1.19.0", "py38_0", sha256="a" * 64, depends=["python >=3.8,<3.9.0a0"]),
+        "numpy-1.20.0-py38_0.tar.bz2": record("numpy", "1.20.0", "py38_0", size=123456789),
+        "Pillow_SIMD-7.0.0-0.tar.bz2": record("Pillow_SIMD", "7.0.0", "0"),
+    },
+    "packages.conda": {
+        "numpy-1.21.0-py38_0.conda": record("numpy", "1.21.0", "py38_0"),
+    },
+    "removed": ["x-1.0-0.tar.bz2"],
+    "repodata_version": 1,
+}
+
+repodata_noarch = {
+    "packages": {
+        "numpy-1.19.0-py38_0.tar.bz2": record("numpy", "1.19.0", "py38_0", subdir='noarch'),
+        "six-1.15.0-py_0.tar.bz2": record("six", "1.15.0", "py_0", subdir='noarch'),
+    },
+}
+
+
+@pytest.fixture
+def channel_files(tmp_path, monkeypatch):
+    monkeypatch.setenv('MACHNIX_CACHE_DIR', str(tmp_path / 'cache'))
+    # a tiny buffer makes values cross chunk boundaries
+    monkeypatch.setattr(conda_index, 'CHUNK_SIZE', 7)
+    files = []
+    for name, data, indent in (('linux.json', repodata_linux, 2), ('noarch.json', repodata_noarch, None)):
+        file = tmp_path / name
+        file.write_text(json.dumps(data, indent=indent))
+        files.append(str(file))
+    return files
+
+
+def test_iter_repodata_packages(channel_files):
+    packages = list(iter_repodata_packages(channel_files[0]))
+    assert {fname: record for fname, record, _ in packages} == repodata_linux['packages']
+    assert all(json.loads(record_json) == record for _, record, record_json in packages)
+
+
+def test_channel_index(channel_files):
+    index = CondaChannelIndex('test', channel_files)
+    assert 'numpy' in index and 'pillow-simd' in index and 'six' in index
+    assert 'not-existing' not in index
+    numpy = index['numpy']
+    assert set(numpy) == {'1.19.0', '1.20.0'}
+    build = numpy['1.19.0']['py38_0']
+    assert build['fname'] == "numpy-1.19.0-py38_0.tar.bz2"
+    assert build['subdir'] == 'linux-64'
+    assert build['collisions'] == [('numpy', 'noarch')]
+    with pytest.raises(KeyError):
+        index['not-existing']
+
+
+def test_channel_index_reused(channel_files, tmp_path, monkeypatch):
+    CondaChannelIndex('test', channel_files)
+
+    def fail(*args):
+        raise AssertionError("index built again")
+    monkeypatch.setattr(conda_index, 'build_index', fail)
+    assert '1.20.0' in CondaChannelIndex('test', channel_files)['numpy']
+
+
+def test_channel_index_without_cache_dir(channel_files, monkeypatch):
+    monkeypatch.setenv('MACHNIX_CACHE_DIR', '')
+
+    def fail(*args):
+        raise AssertionError("index built without a cache dir")
+    monkeypatch.setattr(conda_index, 'build_index', fail)
+    index = CondaChannelIndex('test', channel_files)
+    assert 'pillow-simd' in index and 'not-existing' not in index
+    assert set(index['numpy']) == {'1.19.0', '1.20.0'}
+    build = index['numpy']['1.19.0']['py38_0']
+    assert build['collisions'] == [('numpy', 'noarch')]
+    assert build['python_constraint'] == ("python >=3.8,<3.9.0a0",)
+
+
+@pytest.mark.parametrize("depends, expected", [
+    ([], None),
+    (["numpy", "python_abi 3.8.* *_cp38"], None),
+    (["python >=3.8,<3.9.0a0", "numpy"], ["python >=3.8,<3.9.0a0"]),
+    (["pypy3.6 >=7.3"], None),
+    (["pypy >=7.3", "python >=3.6"], False),
+])
+def test_python_constraint(depends, expected):
+    assert conda_index.python_constraint(dict(depends=depends)) == expected
+
+
+@pytest.mark.parametrize("constraint, py_ver, expected", [
+    (("python >=3.8,<3.9.0a0",), '3.8.5', True),
+    (("python >=3.8,<3.9.0a0",), '3.9.0', False),
+    (("python >=2.7", "python <3"), '2.7.18', True),
+    (("python 3.8.*",), '3.8.5', True),
+])
+def test_python_constraint_ok(constraint, py_ver, expected):
+    assert conda_index.python_constraint_ok(constraint, parse_ver(py_ver)) == expected
+
+
+def test_python_constraint_indexed(channel_files):
+    numpy = CondaChannelIndex('test', channel_files)['numpy']
+    assert numpy['1.19.0']['py38_0']['python_constraint'] == ("python >=3.8,<3.9.0a0",)
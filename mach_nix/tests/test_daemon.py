@@ -0,0 +1,100 @@
+import json
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+from mach_nix import daemon
+from mach_nix.cache import cache_info
+from mach_nix.daemon import ResolverServer, request_resolution, default_socket
+from mach_nix.data.bucket_dict import LazyBucketDict
+from mach_nix.inputs import GenerateInputs
+
+
+def test_daemon_resolves_with_warm_providers(tmp_path, monkeypatch):
+    monkeypatch.setenv('MACHNIX_CACHE_DIR', str(tmp_path / 'cache'))
+    (tmp_path / 'db' / 'wheel').mkdir(parents=True)
+    LazyBucketDict(str(tmp_path / 'db' / 'sdist'), data={
+        'requests': {'2.24.0': {'38': {'install_requires': ['idna'], 'sha256': 'a' * 64}}},
+        'idna': {'2.10': {'38': {'sha256': 'b' * 64}}},
+    }).save()
+    for file, content in (('providers.json', 'sdist'), ('conda.json', {}), ('nixpkgs.json', {})):
+        (tmp_path / file).write_text(json.dumps(content))
+    inputs = GenerateInputs(
+        providers_json=str(tmp_path / 'providers.json'),
+        conda_channels_json=str(tmp_path / 'conda.json'),
+        disable_checks='true',
+        nixpkgs_json=str(tmp_path / 'nixpkgs.json'),
+        pypi_deps_db_src=str(tmp_path / 'db'),
+        pypi_fetcher_commit='commit',
+        pypi_fetcher_sha256='sha256',
+        requirements='requests',
+    )
+    socket_path = str(tmp_path / 'daemon.sock')
+    assert request_resolution(socket_path, inputs, '3.8.5', 'x86_64-linux') is None
+    server = ResolverServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        response = request_resolution(socket_path, inputs, '3.8.5', 'x86_64-linux')
+        assert response['ok'] and response['error'] is None
+        assert 'requests' in response['expr'] and 'idna' in response['expr']
+        inputs.requirements = 'idna'
+        response = request_resolution(socket_path, inputs, '3.8.5', 'x86_64-linux')
+        assert response['ok'] and 'requests' not in response['expr']
+        assert len(server.state.providers) == 1
+        inputs.requirements = 'not-existing'
+        response = request_resolution(socket_path, inputs, '3.8.5', 'x86_64-linux')
+        assert not response['ok'] and response['expr'] is None
+        monkeypatch.setattr(daemon, 'MAX_CACHED_RESULTS', 0)
+        inputs.requirements = 'requests'
+        assert request_resolution(socket_path, inputs, '3.8.5', 'x86_64-linux')['ok']
+        assert sum(info.size for info in cache_info()) == 0
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def test_socket_only_accessible_by_user(tmp_path, monkeypatch):
+    monkeypatch.delenv('MACHNIX_DAEMON_SOCKET', raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    socket_path = default_socket()
+    with ResolverServer(socket_path):
+        assert stat.S_IMODE(os.stat(os.path.dirname(socket_path)).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+    # a stale socket of a previous daemon is replaced
+    with ResolverServer(socket_path):
+        pass
+    os.chmod(os.path.dirname(socket_path), 0o755)
+    with pytest.raises(PermissionError):
+        ResolverServer(socket_path)
+
+
+def test_socket_path_taken_by_other_file(tmp_path):
+    path = tmp_path / 'daemon.sock'
+    path.write_text('not a socket')
+    with pytest.raises(PermissionError):
+        ResolverServer(str(path))
+    assert path.read_text() == 'not a socket'
+
+
+def test_malformed_response(tmp_path):
+    socket_path = str(tmp_path / 'daemon.sock')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen(1)
+
+        def reply_truncated():
+            conn, _ = server.accept()
+            with conn:
+                conn.recv(1 << 16)
+                conn.sendall(b'{"ok": true, "expr": "{ pkgs')
+
+        thread = threading.Thread(target=reply_truncated)
+        thread.start()
+        response = request_resolution(socket_path, GenerateInputs(*[''] * 8), '3.9.5', 'x86_64-linux')
+        thread.join()
+    assert not response['ok'] and 'malformed response' in response['error']
@@ -0,0 +1,27 @@
+import os
+
+from mach_nix.fingerprint import dir_fingerprint
+
+
+def test_dir_fingerprint_changes_with_content(tmp_path):
+    (tmp_path / 'db' / 'sub').mkdir(parents=True)
+    (tmp_path / 'db' / 'sub' / 'a.json').write_text('{"a": 1}')
+    before = dir_fingerprint(tmp_path / 'db')
+    assert dir_fingerprint(tmp_path / 'db') == before
+    (tmp_path / 'db' / 'sub' / 'a.json').write_text('{"a": 22}')
+    changed = dir_fingerprint(tmp_path / 'db')
+    assert changed != before
+    (tmp_path / 'db' / 'b.json').write_text('{}')
+    assert dir_fingerprint(tmp_path / 'db') not in (before, changed)
+
+
+def test_dir_fingerprint_does_not_read_files(tmp_path):
+    (tmp_path / 'db').mkdir()
+    (tmp_path / 'db' / 'a.json').write_text('{"a": 1}')
+    before = dir_fingerprint(tmp_path / 'db')
+    os.chmod(tmp_path / 'db' / 'a.json', 0)
+    assert dir_fingerprint(tmp_path / 'db') == before
+    # same size, but modified
+    st = os.stat(tmp_path / 'db' / 'a.json')
+    os.utime(tmp_path / 'db' / 'a.json', ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert dir_fingerprint(tmp_path / 'db') != before
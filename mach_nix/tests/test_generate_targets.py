@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess as sp
+import sys
+
+from mach_nix import generate_targets
+from mach_nix.data.bucket_dict import LazyBucketDict
+from mach_nix.resolution_cache import ResolutionCache
+
+
+def make_env(tmp_path, targets, idna_pyvers=('38', '310')):
+    (tmp_path / 'db' / 'wheel').mkdir(parents=True)
+    LazyBucketDict(str(tmp_path / 'db' / 'sdist'), data={
+        'requests': {'2.24.0': {'38': {'install_requires': ['idna'], 'sha256': 'a' * 64}, '310': '38'}},
+        'idna': {'2.10': {'38': {'sha256': 'b' * 64}, **{v: '38' for v in idna_pyvers if v != '38'}}},
+    }).save()
+    for file, content in (('providers.json', 'sdist'), ('conda.json', {}), ('nixpkgs.json', {})):
+        (tmp_path / file).write_text(json.dumps(content))
+    return dict(
+        providers=tmp_path / 'providers.json',
+        conda_channels_json=tmp_path / 'conda.json',
+        nixpkgs_json=tmp_path / 'nixpkgs.json',
+        pypi_deps_db_src=tmp_path / 'db',
+        disable_checks='true',
+        pypi_fetcher_commit='commit',
+        pypi_fetcher_sha256='sha256',
+        requirements='requests',
+        targets=json.dumps(targets),
+        out_dir=tmp_path,
+        MACHNIX_CACHE_DIR=tmp_path / 'cache',
+    )
+
+
+def test_resolve_multiple_targets(tmp_path, monkeypatch):
+    env = make_env(tmp_path, [
+        dict(py_ver_str='3.8.5', system='x86_64-linux'),
+        dict(py_ver_str='3.10.2', system='aarch64-linux', out_file=str(tmp_path / 'aarch64.nix')),
+    ])
+    for key, val in env.items():
+        monkeypatch.setenv(key, str(val))
+    generate_targets.main()
+    for out_file in (tmp_path / 'x86_64-linux-python3.8.5.nix', tmp_path / 'aarch64.nix'):
+        expr = out_file.read_text()
+        assert 'requests' in expr and 'idna' in expr
+
+
+def test_failing_target_does_not_block_workers(tmp_path):
+    # idna is not available for python 3.10, the resolver exits for that target
+    env = make_env(tmp_path, [
+        dict(py_ver_str='3.10.2', system='x86_64-linux'),
+        dict(py_ver_str='3.8.5', system='x86_64-linux'),
+    ], idna_pyvers=('38',))
+    env = {**os.environ, **{key: str(val) for key, val in env.items()}, 'MACHNIX_WORKERS': '2'}
+    proc = sp.run([sys.executable, '-m', 'mach_nix.generate_targets'], env=env, capture_output=True, text=True,
+                  timeout=60)
+    assert proc.returncode == 1
+    assert 'resolution failed for python 3.10.2 on x86_64-linux' in proc.stderr
+    assert 'resolution failed for python 3.8.5' not in proc.stderr
+    assert 'idna' in (tmp_path / 'x86_64-linux-python3.8.5.nix').read_text()
+
+
+def test_unwritable_resolution_cache(tmp_path, monkeypatch, capsys):
+    env = make_env(tmp_path, [dict(py_ver_str='3.8.5', system='x86_64-linux')])
+    for key, val in env.items():
+        monkeypatch.setenv(key, str(val))
+
+    def put(*args):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(ResolutionCache, 'put', put)
+    generate_targets.main()
+    assert 'idna' in (tmp_path / 'x86_64-linux-python3.8.5.nix').read_text()
+    assert 'could not write resolution to cache' in capsys.readouterr().err
+
+
+def test_resolution_cache_key_covers_conda_repodata(tmp_path):
+    from mach_nix.generate import resolution_cache_inputs
+    from mach_nix.inputs import GenerateInputs
+    env = make_env(tmp_path, [])
+    repodata = tmp_path / 'repodata.json'
+    repodata.write_text(json.dumps({'packages': {}}))
+    env['conda_channels_json'].write_text(json.dumps({'main': [str(repodata)]}))
+    inputs = GenerateInputs(
+        providers_json=str(env['providers']),
+        conda_channels_json=str(env['conda_channels_json']),
+        disable_checks='true',
+        nixpkgs_json=str(env['nixpkgs_json']),
+        pypi_deps_db_src=str(env['pypi_deps_db_src']),
+        pypi_fetcher_commit='commit',
+        pypi_fetcher_sha256='sha256',
+        requirements='requests',
+    )
+    before = ResolutionCache.key(resolution_cache_inputs(inputs, '3.8.5', 'x86_64-linux'))
+    assert ResolutionCache.key(resolution_cache_inputs(inputs, '3.8.5', 'x86_64-linux')) == before
+    repodata.write_text(json.dumps({'packages': {'requests-2.24.0-py_0.tar.bz2': {}}}))
+    assert ResolutionCache.key(resolution_cache_inputs(inputs, '3.8.5', 'x86_64-linux')) != before
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+# generous, to not be flaky on slow machines. Eagerly importing rich, networkx and pkg_resources took ~0.4s
+IMPORT_BUDGET_US = 1_000_000
+
+
+def import_times(module):
+    """
+    Cumulative import time in microseconds of each module imported by a fresh interpreter importing `module`
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_generate_defers_heavy_imports():
+    times = import_times('mach_nix.generate')
+    for heavy in ('rich', 'networkx', 'tree_format', 'pkg_resources'):
+        assert heavy not in times
+    assert times['mach_nix.generate'] < IMPORT_BUDGET_US
@@ -0,0 +1,51 @@
+import json
+
+from mach_nix.data.nixpkgs import NixpkgsIndex
+from mach_nix.versions import parse_ver
+
+nixpkgs_json = {
+    'requests': dict(pname='requests', version='2.24.0', requirements='chardet\nidna'),
+    'django_2_2': dict(pname='Django', version='2.2.16', requirements=None),
+    'django_3': dict(pname='Django', version='3.1.2', requirements=None),
+    'broken': dict(pname='broken', version='not a version', requirements=None),
+    'other': None,
+}
+
+
+def test_index_cached_across_runs(tmp_path, monkeypatch):
+    monkeypatch.setenv('MACHNIX_CACHE_DIR', str(tmp_path / 'cache'))
+    json_file = tmp_path / 'nixpkgs.json'
+    json_file.write_text(json.dumps(nixpkgs_json))
+    index = NixpkgsIndex(str(json_file))
+    assert list((tmp_path / 'cache' / 'nixpkgs').iterdir())
+
+    def fail(*args):
+        raise AssertionError("nixpkgs json parsed again")
+    monkeypatch.setattr(NixpkgsIndex, '_parse', fail)
+    cached = NixpkgsIndex(str(json_file))
+    assert cached.data == index.data
+    assert cached.requirements == index.requirements
+    assert cached.find_best_nixpkgs_candidate('django', parse_ver('3.1.2')) == 'django_3'
+    assert cached.exists('requests', parse_ver('2.24.0'))
+
+
+def test_cache_invalidated_on_change(tmp_path, monkeypatch):
+    monkeypatch.setenv('MACHNIX_CACHE_DIR', str(tmp_path / 'cache'))
+    json_file = tmp_path / 'nixpkgs.json'
+    json_file.write_text(json.dumps(nixpkgs_json))
+    NixpkgsIndex(str(json_file))
+    json_file.write_text(json.dumps(dict(nixpkgs_json, six=dict(pname='six', version='1.15.0', requirements=None))))
+    assert NixpkgsIndex(str(json_file)).exists('six')
+
+
+def test_corrupt_cache_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setenv('MACHNIX_CACHE_DIR', str(tmp_path / 'cache'))
+    json_file = tmp_path / 'nixpkgs.json'
+    json_file.write_text(json.dumps(nixpkgs_json))
+    NixpkgsIndex(str(json_file))
+    cache_file, = (tmp_path / 'cache' / 'nixpkgs').iterdir()
+    # truncated pickle, pickle of another type, and a pickle referencing a missing attribute
+    for content in (cache_file.read_bytes()[:50], b'\x80\x04K\x01.', b'\x80\x04\x95\x00\x00\x00\x00\x00\x00\x00\x00'
+                    b'\x8c\x08builtins\x94\x8c\x07missing\x94\x93\x94.'):
+        cache_file.write_bytes(content)
+        assert NixpkgsIndex(str(json_file)).exists('requests', parse_ver('2.24.0'))
@@ -0,0 +1,103 @@
+import pytest
+
+from mach_nix.data.bucket_dict import LazyBucketDict
+from mach_nix.data.packed_db import PackedDict, PackedTable, pack_bucket_dir, open_db, PACKED_EXT
+
+
+db_content = {
+    'requests': {'2.24.0': {'38': {'install_requires': ['chardet', 'idna']}, '39': '38'}},
+    'numpy': {'1.19.0': {'38': {'python_requires': ['>=3.6']}}},
+    'zope-interface': {'5.1.0': {'27': {}}},
+    'ünicode': {'1.0': {'38': {}}},
+    'six': {'py3': {'1.16.0': {'six-1.16.0-py3-none-any.whl': {}}},
+            'cp39': {'1.16.0': {'six-1.16.0-cp39-cp39-manylinux1_x86_64.whl': {}, 'six-1.16.0-cp39-abi3.whl': {}}}},
+}
+
+
+@pytest.fixture
+def json_db(tmp_path):
+    data = LazyBucketDict(f"{tmp_path}/sdist", data=db_content)
+    data.save()
+    return f"{tmp_path}/sdist"
+
+
+def test_pack_roundtrip(json_db):
+    out_file = f"{json_db}{PACKED_EXT}"
+    pack_bucket_dir(json_db, out_file)
+    packed = PackedDict(out_file)
+    assert len(packed) == len(db_content)
+    assert sorted(packed) == sorted(db_content)
+    for key, val in db_content.items():
+        assert key in packed
+        assert packed[key] == val
+    assert 'not-existing' not in packed
+    with pytest.raises(KeyError):
+        packed['not-existing']
+
+
+def test_pack_keeps_order(json_db):
+    pack_bucket_dir(json_db, f"{json_db}{PACKED_EXT}")
+    packed, data = PackedDict(f"{json_db}{PACKED_EXT}"), LazyBucketDict(json_db)
+
+    def assert_same_order(a, b):
+        assert list(a) == list(b)
+        for key in b:
+            if isinstance(b[key], dict):
+                assert_same_order(a[key], b[key])
+
+    for key in db_content:
+        assert_same_order(packed[key], data[key])
+
+
+def test_open_db_prefers_packed(json_db):
+    assert isinstance(open_db(json_db), LazyBucketDict)
+    pack_bucket_dir(json_db, f"{json_db}{PACKED_EXT}")
+    assert isinstance(open_db(json_db), PackedDict)
+
+
+def test_open_db_ignores_packed_from_other_data(json_db, tmp_path, monkeypatch):
+    pack_bucket_dir(json_db, f"{json_db}{PACKED_EXT}")
+    monkeypatch.setenv('MACHNIX_PACKED_DB_DIR', str(tmp_path / 'packed'))
+    (tmp_path / 'packed').mkdir()
+    pack_bucket_dir(json_db, str(tmp_path / 'packed' / f"sdist{PACKED_EXT}"))
+    assert isinstance(open_db(json_db), PackedDict)
+    data = LazyBucketDict(json_db)
+    data['requests'] = {'2.25.0': {'39': {}}}
+    data.save()
+    db = open_db(json_db)
+    assert isinstance(db, LazyBucketDict)
+    assert list(db['requests']) == ['2.25.0']
+
+
+def test_open_db_ignores_broken_packed_file(json_db):
+    pack_bucket_dir(json_db, f"{json_db}{PACKED_EXT}")
+    with open(f"{json_db}{PACKED_EXT}", 'rb') as f:
+        content = f.read()
+    # empty, truncated header, truncated table
+    for broken in (b'', content[:6], content[:42]):
+        with open(f"{json_db}{PACKED_EXT}", 'wb') as f:
+            f.write(broken)
+        assert isinstance(open_db(json_db), LazyBucketDict)
+
+
+def test_package_records_decoded_lazily(json_db):
+    out_file = f"{json_db}{PACKED_EXT}"
+    pack_bucket_dir(json_db, out_file)
+    record = PackedDict(out_file)['requests']
+    assert isinstance(record, PackedTable)
+    assert not record._decoded
+    assert record['2.24.0']['39'] == '38'
+    assert list(record._decoded) == ['2.24.0']
+
+
+def test_prefetch(json_db):
+    data = LazyBucketDict(json_db)
+    data.prefetch(['requests', 'numpy', 'not-existing'])
+    assert data._pending
+    for key, val in db_content.items():
+        assert data[key] == val
+    assert 'not-existing' not in data
+    pack_bucket_dir(json_db, f"{json_db}{PACKED_EXT}")
+    packed = PackedDict(f"{json_db}{PACKED_EXT}")
+    packed.prefetch(['requests', 'not-existing'])
+    assert packed['requests'] == db_content['requests']
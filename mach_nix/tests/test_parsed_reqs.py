@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+from mach_nix.requirements import parse_reqs, parse_reqs_preparsed
+
+# the crawlers aren't a package, their sources are imported directly
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'pypi-crawlers', 'src'))
+parsed_reqs = pytest.importorskip('parsed_reqs')
+
+
+def as_tuples(reqs):
+    return [(r.name, r.extras, r.specs, r.build, r.marker) for r in reqs]
+
+
+@pytest.mark.parametrize("line", [
+    'requests',
+    'idna>=2.5,<3',
+    'foo[a,b] (>=1.0) ; python_version >= "3" and extra == "bar"',
+    'foo~=1.0',
+    'foo==1.0.*',
+])
+def test_preparsed_line(line):
+    parsed = parsed_reqs.parse_lines([line])
+    assert parsed[0] is not None
+    assert as_tuples(parse_reqs_preparsed([line], parsed)) == as_tuples(parse_reqs(line))
+
+
+@pytest.mark.parametrize("line", [
+    # special cased by mach-nix
+    'numpy==*',
+    'pytz>dev',
+    'pytz (>dev)',
+    # legacy specifiers
+    'foo>=1.0-SNAPSHOT',
+    'foo>=1.0.*',
+])
+def test_special_lines_not_preparsed(line):
+    assert parsed_reqs.parse_line(line) is None
+    parsed = parsed_reqs.parse_lines([line, 'requests'])
+    assert as_tuples(parse_reqs_preparsed([line, 'requests'], parsed)) == as_tuples(parse_reqs([line, 'requests']))
+
+
+def test_arbitrary_equality_not_preparsed():
+    # not supported by mach-nix' parser, storing it pre-parsed would change behavior
+    assert parsed_reqs.parse_line('foo===1.0') is None
+
+
+def test_continued_lines_not_preparsed():
+    lines = ['foo>=1.0,\\', '<2.0', 'requests']
+    assert parsed_reqs.parse_lines(lines) is None
@@ -0,0 +1,90 @@
+import pytest
+from resolvelib.resolvers import RequirementInformation
+
+from mach_nix.requirements import parse_reqs
+from mach_nix.resolver.preferences import get_preference_strategy
+
+
+class Parent:
+    def __init__(self, name):
+        self.name = name
+
+
+def req(line):
+    return list(parse_reqs(line))[0]
+
+
+class IterMapping(dict):
+    """mimics resolvelib's IteratorMapping, which returns a new iterator on each access"""
+    def __getitem__(self, k):
+        return iter(dict.__getitem__(self, k))
+
+
+def preference_order(strategy, information, num_candidates, backtrack_causes=()):
+    information = IterMapping({
+        name: [RequirementInformation(req(r), parent and Parent(parent)) for r, parent in infos]
+        for name, infos in information.items()})
+    def key(name):
+        return strategy.key(name, {}, num_candidates.__getitem__, information, list(backtrack_causes))
+
+    # depths are learned along the way, like during resolution
+    for name in information:
+        key(name)
+    return sorted(information, key=key)
+
+
+def test_candidates_strategy():
+    order = preference_order(
+        get_preference_strategy('candidates'),
+        dict(a=[('a', None)], b=[('b', None)]),
+        dict(a=5, b=2))
+    assert order == ['b', 'a']
+
+
+def test_pip_strategy():
+    order = preference_order(
+        get_preference_strategy('pip'),
+        dict(
+            setuptools=[('setuptools==50.0', None)],
+            deep=[('deep', 'mid')],
+            mid=[('mid', 'root')],
+            root=[('root', None)],
+            pinned=[('pinned==1.0', 'mid')],
+            restricted=[('restricted>1.0', None)],
+        ),
+        dict(setuptools=1, deep=1, mid=1, root=10, pinned=5, restricted=20))
+    assert order == ['pinned', 'restricted', 'root', 'mid', 'deep', 'setuptools']
+
+
+def test_pip_strategy_prefers_backtrack_causes():
+    causes = [RequirementInformation(req('b>1'), Parent('c'))]
+    order = preference_order(
+        get_preference_strategy('pip'),
+        dict(a=[('a', None)], b=[('b', None)], c=[('c', None)]),
+        dict(a=1, b=2, c=3),
+        causes)
+    assert order == ['b', 'c', 'a']
+
+
+def test_unknown_strategy():
+    with pytest.raises(Exception):
+        get_preference_strategy('unknown')
+
+
+def test_provider_counts_candidates_of_current_requirements():
+    from mach_nix.resolver.resolvelib_resolver import Provider
+
+    class DepsDB:
+        def count_matches(self, reqs):
+            return {(): 3, ('>=2',): 1}[tuple(str(s) for r in reqs for s in r.specs)]
+
+    class NoCandidates(dict):
+        def __getitem__(self, k):
+            raise AssertionError("candidates iterated for counting")
+
+    provider = Provider(None, DepsDB(), get_preference_strategy('candidates'))
+    information = IterMapping(a=[RequirementInformation(req('a'), None)])
+    assert provider.get_preference('a', {}, NoCandidates(), information, []) == 3
+    # the requirements resolvelib passes are used, independent of earlier find_matches calls
+    information = IterMapping(a=[RequirementInformation(req('a>=2'), None)])
+    assert provider.get_preference('a', {}, NoCandidates(), information, []) == 1
@@ -0,0 +1,45 @@
+import resolvelib
+
+from mach_nix.data.providers import DependencyProviderBase, Candidate, ProviderInfo
+from mach_nix.requirements import parse_reqs
+from mach_nix.resolver.preferences import get_preference_strategy
+from mach_nix.resolver.profiling import ProfilingReporter
+from mach_nix.resolver.resolvelib_resolver import Provider
+from mach_nix.versions import PyVer, parse_ver
+
+
+class DictProvider(DependencyProviderBase):
+    name = 'dict'
+
+    def __init__(self, packages):
+        super().__init__(py_ver=PyVer('3.9.0'), platform='x86_64', system='linux')
+        self.packages = packages
+
+    def all_candidates(self, name, extras, builds):
+        for ver in self.packages.get(name, {}):
+            yield Candidate(name, parse_ver(ver), ver, extras, provider_info=ProviderInfo(self))
+
+    def get_pkg_reqs(self, c: Candidate):
+        return list(parse_reqs(self.packages[c.name][c.raw_version])), []
+
+
+packages = dict(
+    a={'2.0': 'c==1.0', '1.0': 'c'},
+    b={'1.0': 'c==2.0'},
+    c={'1.0': '', '2.0': ''},
+)
+
+
+def test_profile_records_rejections():
+    profiler = ProfilingReporter()
+    provider = Provider(None, DictProvider(packages), get_preference_strategy('candidates'), profiler)
+    result = resolvelib.Resolver(provider, profiler).resolve(list(parse_reqs('a\nb')), max_rounds=100)
+    profiler.finish()
+    assert str(result.mapping['a'].ver) == '1.0'
+    profile = profiler.toDict()
+    assert profile['result'] == 'ok'
+    assert profile['rounds'] > 0
+    assert profile['packages']['c']['pins'] == 1
+    assert profile['rejections'] + profile['backtracks'] > 0
+    assert profile['find_matches']['calls'] > 0
+    assert profile['get_dependencies']['calls'] == profile['pins'] + profile['rejections']
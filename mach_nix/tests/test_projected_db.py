@@ -0,0 +1,96 @@
+from mach_nix.data import providers, projected_db
+from mach_nix.data.bucket_dict import LazyBucketDict
+from mach_nix.data.projected_db import project, PACKED_EXT
+from mach_nix.versions import PyVer
+
+sdist_content = {
+    'requests': {
+        '2.24.0': {'38': {'install_requires': ['chardet', 'idna']}, '39': '38'},
+        '2.25.0': '2.24.0',
+    },
+    'numpy': {
+        '1.19.0': {'39': {'python_requires': ['>=3.6']}},
+        '1.22.0': {'39': {'python_requires': ['>=3.9.1']}},
+        '2.0.0': {'39': {'python_requires': ['>=3.10']}},
+    },
+    'zope-interface': {'5.1.0': {'27': {}}},
+}
+
+wheel_content = {
+    'six': {
+        'py2.py3': {
+            '1.15.0': {'six-1.15.0-py2.py3-none-any.whl': {'requires_dist': ['foo; extra == "bar"']}},
+            '1.16.0': {'six-1.16.0-py2.py3-none-any.whl': '1.15.0@six-1.15.0-py2.py3-none-any.whl'},
+        },
+        'cp39': {
+            '1.16.0': {
+                'six-1.16.0-cp39-cp39-manylinux1_x86_64.whl': {'requires_python': '>=3.6,'},
+                'six-1.16.0-cp39-cp39-win_amd64.whl': {},
+            },
+        },
+        'cp310': {'1.17.0': {'six-1.17.0-cp310-cp310-manylinux1_x86_64.whl': {}}},
+    },
+    'old': {'py2': {'1.0': {'old-1.0-py2-none-any.whl': {}}}},
+}
+
+
+def make_db(tmp_path):
+    LazyBucketDict(str(tmp_path / 'sdist'), data=sdist_content).save()
+    LazyBucketDict(str(tmp_path / 'wheel'), data=wheel_content).save()
+    return str(tmp_path)
+
+
+def candidates(provider, name):
+    result = []
+    for c in provider.all_candidates(name, ('bar',), None):
+        result.append((c.name, c.raw_version, c.provider_info.wheel_fname, c.provider_info.data, provider.get_pkg_reqs(c)))
+    return result
+
+
+def test_projection_matches_full_db(tmp_path):
+    db = make_db(tmp_path)
+    target = dict(py_ver=PyVer('3.9.5'), platform='x86_64', system='linux')
+    project(db, **target, out_dir=db)
+    for name in ('sdist', 'wheel'):
+        assert (tmp_path / f"{name}-py3.9.5-x86_64-linux{PACKED_EXT}").is_file()
+    for cls, names in ((providers.SdistDependencyProvider, sdist_content), (providers.WheelDependencyProvider, wheel_content)):
+        full = cls(f"{db}/{cls.name}", **target, use_projection=False)
+        projected = cls(f"{db}/{cls.name}", **target)
+        assert full.projected is None and projected.projected is not None
+        for name in list(names) + ['not-existing']:
+            assert candidates(projected, name) == candidates(full, name)
+    # incompatible releases are not part of the projection
+    sdist = providers.SdistDependencyProvider(f"{db}/sdist", **target)
+    assert sorted(sdist.projected) == ['numpy', 'requests']
+    assert sorted(sdist.projected['numpy']) == ['1.19.0', '1.22.0']
+    wheel = providers.WheelDependencyProvider(f"{db}/wheel", **target)
+    assert sorted(wheel.projected) == ['six']
+    assert [w[2] for w in wheel.projected['six']] == [
+        'six-1.15.0-py2.py3-none-any.whl',
+        'six-1.16.0-py2.py3-none-any.whl',
+        'six-1.16.0-cp39-cp39-manylinux1_x86_64.whl',
+    ]
+
+
+def test_projection_is_per_target(tmp_path):
+    db = make_db(tmp_path)
+    project(db, PyVer('3.9.0'), 'x86_64', 'linux', db)
+    sdist = providers.SdistDependencyProvider(f"{db}/sdist", py_ver=PyVer('3.9.0'), platform='x86_64', system='linux')
+    assert [c.raw_version for c in sdist.all_candidates('numpy', (), None)] == ['1.19.0']
+    other = providers.SdistDependencyProvider(f"{db}/sdist", py_ver=PyVer('3.9.5'), platform='x86_64', system='linux')
+    assert other.projected is None
+
+
+def test_outdated_projection_is_ignored(tmp_path, monkeypatch):
+    db = make_db(tmp_path)
+    target = dict(py_ver=PyVer('3.9.5'), platform='x86_64', system='linux')
+    project(db, **target, out_dir=db)
+    assert providers.SdistDependencyProvider(f"{db}/sdist", **target).projected is not None
+    # built by other mach-nix code
+    monkeypatch.setattr(projected_db, 'code_fingerprint', lambda: 'other')
+    assert providers.SdistDependencyProvider(f"{db}/sdist", **target).projected is None
+    monkeypatch.undo()
+    # built from an older DB
+    LazyBucketDict(str(tmp_path / 'wheel'), data={'six': {}}).save()
+    assert providers.WheelDependencyProvider(f"{db}/wheel", **target).projected is None
+    assert providers.SdistDependencyProvider(f"{db}/sdist", **target).projected is not None
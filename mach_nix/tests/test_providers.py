@@ -1,8 +1,11 @@
 import pytest
 
 from mach_nix.data import providers
+from mach_nix.data.bucket_dict import LazyBucketDict
+from mach_nix.data.nixpkgs import NixpkgsIndex
 from mach_nix.data.providers import WheelRelease
-from mach_nix.versions import PyVer
+from mach_nix.requirements import parse_reqs
+from mach_nix.versions import PyVer, parse_ver
 
 
 @pytest.mark.parametrize("expected, py_ver, wheel_fn, system, platform", [
@@ -36,3 +39,164 @@ def test_select_wheel_for_py_ver(expected, py_ver, wheel_fn, system, platform):
     prov = providers.WheelDependencyProvider('', py_ver=PyVer(py_ver), system=system, platform=platform)
     w = WheelRelease(*([""] * 3), wheel_fn, *([""] * 3))
     assert prov._wheel_type_ok(w) == expected
+
+
+@pytest.mark.parametrize("expected, wheel_fns, system, platform", [
+    ('a-1.0-cp39-cp39-manylinux2010_x86_64.whl',
+     ['a-1.0-py3-none-any.whl', 'a-1.0-cp39-cp39-manylinux1_x86_64.whl', 'a-1.0-cp39-cp39-manylinux2010_x86_64.whl'],
+     "linux", "x86_64"),
+    # compressed platform tags count with their best tag
+    ('a-1.0-cp39-cp39-manylinux_2_5_x86_64.manylinux1_x86_64.whl',
+     ['a-1.0-cp39-cp39-linux_x86_64.whl', 'a-1.0-cp39-cp39-manylinux_2_5_x86_64.manylinux1_x86_64.whl'],
+     "linux", "x86_64"),
+    # first one wins on equal preference
+    ('a-1.0-py2.py3-none-any.whl', ['a-1.0-py2.py3-none-any.whl', 'a-1.0-py3-none-any.whl'], "linux", "x86_64"),
+    ('a-1.0-py3-none-any.whl',
+     ['a-1.0-cp39-cp39-macosx_11_0_arm64.whl', 'a-1.0-cp39-cp39-macosx_10_9_universal2.whl', 'a-1.0-py3-none-any.whl'],
+     "darwin", "aarch64"),
+    ('a-1.0-cp39-cp39-macosx_10_9_universal2.whl',
+     ['a-1.0-cp39-cp39-macosx_11_0_arm64.whl', 'a-1.0-cp39-cp39-macosx_10_9_universal2.whl'],
+     "darwin", "aarch64"),
+])
+def test_select_preferred_wheel(expected, wheel_fns, system, platform):
+    prov = providers.WheelDependencyProvider('', py_ver=PyVer('3.9.0'), system=system, platform=platform)
+    wheels = [WheelRelease(*([""] * 3), fn, *([""] * 3)) for fn in wheel_fns]
+    assert prov._select_preferred_wheel(wheels).fn == expected
+
+
+class CountingProvider(providers.DependencyProviderBase):
+    name = 'counting'
+
+    def __init__(self, versions):
+        super().__init__(py_ver=PyVer('3.9.0'), platform='x86_64', system='linux')
+        self.versions = versions
+        self.loaded = 0
+
+    def all_candidates(self, name, extras, builds):
+        self.loaded += 1
+        return [providers.Candidate(name, parse_ver(v), v, extras, providers.ProviderInfo(self)) for v in self.versions]
+
+    def get_pkg_reqs(self, c):
+        return [], []
+
+
+def combined_provider(tmp_path, monkeypatch):
+    monkeypatch.setenv('MACHNIX_CACHE_DIR', str(tmp_path / 'cache'))
+    for file, content in (('providers.json', '"wheel,sdist"'), ('conda.json', '{}'), ('nixpkgs.json', '{}')):
+        (tmp_path / file).write_text(content)
+    combined = providers.CombinedDependencyProvider(
+        conda_channels_json=str(tmp_path / 'conda.json'),
+        nixpkgs=NixpkgsIndex(str(tmp_path / 'nixpkgs.json')),
+        provider_settings=providers.ProviderSettings(str(tmp_path / 'providers.json')),
+        pypi_deps_db_src=str(tmp_path),
+        py_ver=PyVer('3.9.0'), platform='x86_64', system='linux')
+    wheel, sdist = CountingProvider(['2.0', '1.0']), CountingProvider(['3.0', '2.0'])
+    combined._all_providers = dict(wheel=wheel, sdist=sdist)
+    return combined, wheel, sdist
+
+
+def test_combined_provider_loads_providers_lazily(tmp_path, monkeypatch):
+    combined, wheel, sdist = combined_provider(tmp_path, monkeypatch)
+    matches = combined.iter_matches(list(parse_reqs('pkg>1.0')))
+    assert str(next(matches).ver) == '2.0'
+    assert sdist.loaded == 0
+    assert [str(c.ver) for c in matches] == ['3.0', '2.0']
+    assert sdist.loaded > 0
+
+
+def test_combined_provider_counts_matches(tmp_path, monkeypatch):
+    combined, wheel, sdist = combined_provider(tmp_path, monkeypatch)
+    reqs = list(parse_reqs('pkg>1.0'))
+    expected = list(combined.iter_matches(reqs))
+
+    def fail(*args):
+        raise AssertionError("candidates iterated for counting")
+    monkeypatch.setattr(combined, 'iter_matches', fail)
+    assert combined.count_matches(reqs) == len(expected) == 3
+
+
+def test_combined_provider_prefers_final_releases_of_any_provider(tmp_path, monkeypatch):
+    combined, wheel, sdist = combined_provider(tmp_path, monkeypatch)
+    wheel.versions, sdist.versions = ['2.0b1'], ['1.0']
+    reqs = list(parse_reqs('pkg'))
+    assert [str(c.ver) for c in combined.iter_matches(reqs)] == ['1.0']
+    assert combined.count_matches(reqs) == 1
+    # pre-releases are selected if no provider has a final release
+    combined, wheel, sdist = combined_provider(tmp_path, monkeypatch)
+    wheel.versions, sdist.versions = ['2.0b1'], ['1.0rc1']
+    assert [str(c.ver) for c in combined.iter_matches(reqs)] == ['2.0b1', '1.0rc1']
+
+
+def test_sdist_provider_uses_preparsed_reqs(tmp_path):
+    install_requires = ["idna>=2.5,<3 ; python_version >= '3'", "chardet 3.0.*"]
+    marker_ast = {'op': '>=', 'lhs': 'python_version', 'rhs': "'3'"}
+    LazyBucketDict(str(tmp_path / 'sdist'), data={'requests': {'2.24.0': {'39': {
+        'install_requires': install_requires,
+        'install_requires_parsed': [
+            ['idna', [], ['<3,>=2.5'], "python_version >= '3'", marker_ast],
+            None,
+        ],
+        'extras_require': {'socks': ['PySocks!=1.5.7']},
+        'extras_require_parsed': {'socks': [['PySocks', [], ['!=1.5.7'], None, None]]},
+    }}}}).save()
+    prov = providers.SdistDependencyProvider(
+        str(tmp_path / 'sdist'), py_ver=PyVer('3.9.0'), platform='x86_64', system='linux')
+    candidate = prov.all_candidates('requests', ('socks',), None)[0]
+    install_reqs, setup_reqs = prov.get_pkg_reqs(candidate)
+    expected = list(parse_reqs(install_requires)) + list(parse_reqs('PySocks!=1.5.7'))
+    assert [(r.name, r.specs, r.marker) for r in install_reqs] == [(r.name, r.specs, r.marker) for r in expected]
+    assert install_reqs[0].marker_ast == marker_ast
+    assert setup_reqs == []
+
+
+def test_sdist_provider_evaluates_markers_in_extras_keys(tmp_path):
+    LazyBucketDict(str(tmp_path / 'sdist'), data={'pkg': {'1.0': {'39': {
+        'extras_require': {
+            ':python_version < "3"': ['futures'],
+            ':python_version >= "3"': ['typing-extensions'],
+            'socks:sys_platform == "win32"': ['win-inet-pton'],
+            'socks': ['PySocks'],
+        },
+    }}}}).save()
+    prov = providers.SdistDependencyProvider(
+        str(tmp_path / 'sdist'), py_ver=PyVer('3.9.0'), platform='x86_64', system='linux')
+    candidate = prov.all_candidates('pkg', ('socks',), None)[0]
+    install_reqs, _ = prov.get_pkg_reqs(candidate)
+    assert [r.name for r in install_reqs] == ['typing-extensions', 'pysocks']
+
+
+def test_candidate_identity_ignores_provider_data():
+    prov = CountingProvider(['1.0'])
+    a = providers.Candidate('pkg', parse_ver('1.0'), '1.0', (), providers.ProviderInfo(prov, data={'big': 'record'}))
+    b = providers.Candidate('pkg', parse_ver('1.0'), '1.0', (), providers.ProviderInfo(prov, data={}))
+    c = providers.Candidate('pkg', parse_ver('1.0'), '1.0', ('extra',), providers.ProviderInfo(prov))
+    assert a == b and hash(a) == hash(b)
+    assert a != c
+    assert b in {a} and c not in {a}
+
+
+def test_find_matches_narrows_incrementally():
+    prov = CountingProvider(['3.0', '2.1', '2.0', '1.0', '0.9'])
+    reqs = list(parse_reqs(['pkg>=1.0', 'pkg<3.0', 'pkg!=2.0']))
+    assert [c.raw_version for c in prov.find_matches(reqs[:2])] == ['2.1', '2.0', '1.0']
+    cache = providers.DependencyProviderBase._matching_indices.cache
+    hits, misses = cache.hits, cache.misses
+    assert [c.raw_version for c in prov.find_matches(reqs)] == ['2.1', '1.0']
+    # only the new requirement is applied, on top of the cached result of the previous ones
+    assert (cache.hits - hits, cache.misses - misses) == (1, 1)
+    # the candidates are loaded and sorted once
+    assert prov.loaded == 1
+    assert [c.raw_version for c in prov.find_matches(list(parse_reqs('pkg>=2.0')))] == ['3.0', '2.1', '2.0']
+    assert prov.loaded == 1
+
+
+def test_find_matches_keeps_candidate_order_within_version():
+    prov = CountingProvider(['2.0', '1.0', '2.0.0', '1.0.0', '2'])
+    assert [c.raw_version for c in prov.find_matches(list(parse_reqs('pkg')))] == ['2.0', '2.0.0', '2', '1.0', '1.0.0']
+
+
+def test_candidates_for_version():
+    prov = CountingProvider(['2.0', '1.0', '1.0.0'])
+    assert [c.raw_version for c in prov.candidates_for_version('pkg', parse_ver('1'))] == ['1.0', '1.0.0']
+    assert prov.candidates_for_version('pkg', parse_ver('3.0')) == []
+    assert prov.loaded == 1
@@ -1,12 +1,15 @@
 import json
 from os import environ
 
+import distlib.markers
 from packaging.requirements import Requirement
 from packaging.specifiers import SpecifierSet
 import pytest
 
 from mach_nix.data.bucket_dict import LazyBucketDict
-from mach_nix.requirements import parse_reqs_line
+from mach_nix.requirements import parse_reqs, parse_reqs_line, normalize_line, parse_line_fast, parse_line_regex, context, \
+    eval_marker, _eval_marker
+from mach_nix.versions import PyVer
 
 
 @pytest.mark.parametrize("input, exp_output", [
@@ -156,3 +159,83 @@ def test_parse_all_conda_reqs(file):
     for pname, pdata in cdata['packages'].items():
         for line in pdata['depends']:
             parse_or_ignore_line_conda(line)
+
+
+fast_lines = [
+    'requests',
+    'requests[socks] ==2.24.0',
+    'requests == 2.24.0',
+    'python>= 3.5',
+    'python >=2.6, !=3.0.*',
+    'pdfminer.six == 20200726',
+    'zope.interface>=4.0,<5.0a0',
+    "unittest2 >=2.0,<3.0 ; python_version == '2.4' or python_version == '2.5'",
+    "pywin32 > 1.0 ; sys.platform == 'win32'",
+    "certifi (==2016.9.26) ; extra == 'certs'",
+    "sphinx ; extra == 'docs'",
+    "zest.releaser[recommended] ; extra == 'maintainer'",
+    'black==19.3b0; python_version >= "3.6"',
+    'foo_bar~=1.4.post1',
+    'foo[a,b]>1.0.dev0,<=2!3.0+local',
+]
+
+other_lines = [
+    'requests 2.24.0',
+    'requests[socks,test] 2.24.0',
+    'hdf5 >=1.10.5,<1.10.6.0a0 mpi_mpich_*',
+    'blas * openblas',
+    'requests >=2.24.0 build123*',
+    'ruamel.yaml >=0.12.4,<0.16|0.16.5.*',
+    'openjdk =8|11',
+    'gitpython >=3.0.8,3.0.*',
+    'ixmp ==0.1.3 1',
+    'requests>=2.24.0 ; python_version<"3"',
+    'requests[socks,]',
+    'requests >=v1.0',
+]
+
+
+@pytest.mark.parametrize("line", fast_lines + other_lines)
+def test_fast_parser_matches_regex_parser(line):
+    line = normalize_line(line)
+    fast = parse_line_fast(line)
+    if line in map(normalize_line, fast_lines):
+        assert fast is not None
+    if fast is not None:
+        assert fast == parse_line_regex(line)
+
+
+@pytest.mark.parametrize("marker", [
+    "python_version >= '3'",
+    "python_version < '3.8' and platform_system == 'Linux'",
+    "sys_platform == 'win32' or extra == 'socks'",
+    "extra == 'socks'",
+])
+@pytest.mark.parametrize("py_ver, system, extra", [
+    ('3.7.0', 'linux', 'socks'),
+    ('3.9.0', 'darwin', 'test'),
+    ('2.7.18', 'linux', None),
+])
+def test_eval_marker(marker, py_ver, system, extra):
+    ctx = context(PyVer(py_ver), 'x86_64', system)
+    interpret_ctx = dict(ctx, extra=extra) if extra else ctx
+    try:
+        expected = bool(distlib.markers.interpret(marker, interpret_ctx))
+    except SyntaxError:
+        with pytest.raises(SyntaxError):
+            eval_marker(marker, ctx, extra)
+        return
+    assert eval_marker(marker, ctx, extra) == expected
+    hits = _eval_marker.cache.hits
+    assert eval_marker(marker, context(PyVer(py_ver), 'x86_64', system), extra) == expected
+    assert _eval_marker.cache.hits == hits + 1
+    if extra is None:
+        assert eval_marker(marker, ctx) == expected
+        assert _eval_marker.cache.hits == hits + 2
+
+
+def test_requirements_interned_by_line():
+    a = list(parse_reqs(['requests>=2.0', 'idna']))
+    b = list(parse_reqs('requests>=2.0\nsix'))
+    assert a[0] is b[0]
+    assert not hasattr(a[0], '__dict__')
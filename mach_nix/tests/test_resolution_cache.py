@@ -0,0 +1,33 @@
+import os
+
+from mach_nix.resolution_cache import ResolutionCache
+
+
+inputs = dict(requirements='requests', py_ver_str='3.9.5', system='x86_64-linux')
+
+
+def test_hit_and_miss(tmp_path):
+    cache = ResolutionCache(str(tmp_path))
+    key = cache.key(inputs)
+    assert key == cache.key(dict(inputs))
+    assert key != cache.key(dict(inputs, py_ver_str='3.8.5'))
+    assert cache.get(key) is None
+    cache.put(key, inputs, 'expr')
+    assert cache.get(key) == 'expr'
+    assert cache.load_stats() == dict(hits=1, misses=1)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResolutionCache(str(tmp_path))
+    keys = [cache.key(dict(inputs, requirements=f"pkg{i}")) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, inputs, 'x' * 1000)
+        os.utime(cache._file(key), (i, i))
+    cache.get(keys[0])
+    cache.max_size = 3500
+    cache.put(cache.key(inputs), inputs, 'x' * 1000)
+    remaining = {key for key, _, _ in cache.entries()}
+    assert keys[0] in remaining
+    assert keys[1] not in remaining
+    assert sum(size for _, size, _ in cache.entries()) <= cache.max_size
+
@@ -0,0 +1,36 @@
+import itertools
+
+import pytest
+from packaging.specifiers import SpecifierSet
+
+from mach_nix.specifiers import SortedVersions, compile_specifier_set
+from mach_nix.versions import parse_ver
+
+versions = [parse_ver(v) for v in (
+    '0.9', '1.0', '1.0.1', '1.0a1', '1.0rc2', '1.0.dev3', '1.0.post1', '1.0.post1.dev1', '1.0+local',
+    '1.0.1+abc', '1.1', '1.1.0a1', '1.2', '1.2.3', '2.0', '2.0b1', '2.0.0.post2', '1!0.5', '1!1.0',
+    '3.0.dev0', '10.0',
+)]
+
+specs = [
+    '<1.0', '<=1.0', '>1.0', '>=1.0', '==1.0', '!=1.0', '<1.0a1', '>1.0a1', '>=1.0.dev3', '<=1.0.post1',
+    '>1.0.post1', '==1.0+local', '!=1.0+local', '==1.*', '!=1.0.*', '==1!1.*', '~=1.0', '~=1.0.0', '~=1.0a1',
+    '<2.0', '>=2.0b1', '<=1!1.0', '>0.9', '==2.0',
+]
+
+
+@pytest.mark.parametrize("spec", specs + [','.join(c) for c in itertools.combinations(specs[:12], 2)])
+def test_compiled_specifier_set_like_packaging(spec):
+    specset = SpecifierSet(spec)
+    compiled = compile_specifier_set(specset)
+    sv = SortedVersions(versions)
+    expected = set(specset.filter(versions))
+    assert {sv.versions[i] for i in compiled.filter_indices(sv)} == expected
+    assert {v for v in versions if compiled.contains(v)} == expected
+
+
+def test_filter_subset_keeps_pre_release_fallback():
+    sv = SortedVersions(versions)
+    pre_only = {sv.index[parse_ver('2.0b1')]}
+    assert compile_specifier_set(SpecifierSet()).filter_indices(sv, pre_only) == pre_only
+    assert parse_ver('2.0b1') not in {sv.versions[i] for i in compile_specifier_set(SpecifierSet()).filter_indices(sv)}
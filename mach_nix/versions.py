@@ -2,9 +2,56 @@ import sys
 import traceback
 
 import packaging.version
-from packaging.version import parse as parse_ver, Version
+from packaging.version import Version
 
-__all__ = ['parse_ver', 'Version', 'PyVer']
+__all__ = ['parse_ver', 'Version', 'PyVer', 'VersionTable', 'version_key', 'base_key']
+
+
+class VersionTable:
+    """
+    Interns parsed versions, so each distinct version string is only parsed once
+    and all providers share the same version objects.
+    """
+
+    def __init__(self):
+        self._versions = {}
+
+    def parse(self, raw: str):
+        try:
+            return self._versions[raw]
+        except KeyError:
+            ver = self._versions[raw] = packaging.version.parse(raw)
+            return ver
+
+    def register(self, versions: dict):
+        """
+        Adds already parsed versions (eg. loaded from a cache), given as {raw_string: version}.
+        Versions which are already known are kept.
+        """
+        for raw, ver in versions.items():
+            self._versions.setdefault(raw, ver)
+
+    def __len__(self):
+        return len(self._versions)
+
+
+def version_key(ver) -> tuple:
+    """
+    Precomputed sort key of a parsed version. Comparing keys is equivalent to comparing
+    the versions, but skips the comparison logic of packaging.version.
+    """
+    return ver._key
+
+
+def base_key(ver) -> tuple:
+    """
+    Key of epoch + release segment (trailing zeros removed)
+    """
+    return ver._key[:2]
+
+
+version_table = VersionTable()
+parse_ver = version_table.parse
 
 
 class PyVer:
@@ -12,5 +12,6 @@ mach-nix.mkPython {
     pkginfo
     peewee
     bounded-pool-executor
+    distlib
   '';
 }
\ No newline at end of file
@@ -12,6 +12,7 @@ from typing import Union
 import pkginfo
 import requests
 from bucket_dict import LazyBucketDict
+from parsed_reqs import parse_lines
 from utils import parallel
 
 email = os.environ.get("EMAIL")
@@ -242,6 +243,10 @@ def main():
                 val = getattr(r, key)
                 if val:
                     dump_dict[name][pyver][ver][fn][key] = val
+            if r.requires_dist:
+                parsed = parse_lines(r.requires_dist)
+                if parsed:
+                    dump_dict[name][pyver][ver][fn]['requires_dist_parsed'] = parsed
         compress(dump_dict)
         dump_dict.save()
 
@@ -4,6 +4,7 @@ from typing import Set, Dict
 
 from bucket_dict import LazyBucketDict
 from db import Package as P
+from parsed_reqs import parse_lines
 
 
 @dataclass
@@ -65,9 +66,26 @@ def pkg_to_dict(pkg):
             print(val)
             raise Exception('Requirements must be list of strings')
         new_release[key] = val
+    add_parsed_reqs(new_release)
     return new_release
 
 
+def add_parsed_reqs(release):
+    for key in ('setup_requires', 'install_requires'):
+        if key in release:
+            parsed = parse_lines(release[key])
+            if parsed:
+                release[f"{key}_parsed"] = parsed
+    if 'extras_require' in release:
+        parsed = {}
+        for extra, reqs in release['extras_require'].items():
+            parsed_reqs = parse_lines(reqs)
+            if parsed_reqs:
+                parsed[extra] = parsed_reqs
+        if parsed:
+            release['extras_require_parsed'] = parsed
+
+
 def insert(py_ver, name, ver, release, target):
     ver = ver.strip()
     # create structure
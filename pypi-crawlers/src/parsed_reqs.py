@@ -0,0 +1,55 @@
+import re
+from typing import List, Optional
+
+from distlib.util import parse_marker
+from packaging.requirements import Requirement, InvalidRequirement
+from packaging.specifiers import Specifier
+
+# Requirement lines are stored pre-parsed next to the raw lines (key: `<key>_parsed`), so mach-nix
+# doesn't need to parse them at resolve time. Each raw line maps to an entry at the same index:
+#   [name, extras, specs, marker, marker_ast]
+# specs:      list of specifier set strings (alternatives), empty if unrestricted
+# marker:     the marker as written in the line, or null
+# marker_ast: the marker parsed by distlib, or null
+# Lines which can't be represented this way map to null and are parsed by mach-nix as before.
+# This includes all lines mach-nix special cases (eg. `numpy==*` or `pytz>dev`), which packaging
+# parses into legacy specifiers. Lists with continued lines (trailing `\`) aren't pre-parsed at all.
+
+re_extras = re.compile(r"[^\[;]*\[([^\]]*)\]")
+re_marker_extras = re.compile(r"extra *== *'?(([a-z]|[A-Z]|-|_|\.|\d)+)'?")
+
+
+def parse_line(line: str) -> Optional[list]:
+    if not isinstance(line, str) or '#' in line or '@' in line:
+        return None
+    try:
+        req = Requirement(line)
+    except InvalidRequirement:
+        return None
+    if any(not isinstance(spec, Specifier) or spec.operator == '===' for spec in req.specifier):
+        return None
+    marker, marker_ast = None, None
+    if req.marker is not None:
+        marker = line.split(';', 1)[1].strip()
+        try:
+            marker_ast, rest = parse_marker(marker)
+        except SyntaxError:
+            return None
+        if rest:
+            return None
+    # keep the order of extras as written, packaging returns a set
+    extras_match = re_extras.match(line)
+    extras = [e.strip() for e in extras_match.group(1).split(',') if e.strip()] if extras_match else []
+    # extras referenced in the marker are treated like selected extras, same as mach-nix's parser does
+    extras += [m[0] for m in re_marker_extras.findall(marker or '')]
+    specs = [str(req.specifier)] if req.specifier else []
+    return [req.name, extras, specs, marker, marker_ast]
+
+
+def parse_lines(lines: List[str]) -> Optional[list]:
+    if any(isinstance(line, str) and line.rstrip().endswith('\\') for line in lines):
+        return None
+    parsed = [parse_line(line) for line in lines]
+    if not any(parsed):
+        return None
+    return parsed